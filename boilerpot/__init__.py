@@ -1,3 +1,8 @@
-from .boilerpot import extract_text, __version__
+from .boilerpot import extract_text, Extractor, __version__
+from .batch import extract_many
+from .cache import ExtractionCache
+from .dedup import DuplicateIndex
+from .structured import extract_blocks
+from .templates import TemplateIndex
 
-__all__ = ['extract_text', __version__]
+__all__ = ['extract_text', 'extract_blocks', 'Extractor', 'extract_many', 'ExtractionCache', 'DuplicateIndex', 'TemplateIndex', __version__]
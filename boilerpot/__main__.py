@@ -1,11 +1,77 @@
-from .boilerpot import extract_text
+""" python -m boilerpot [options] FILE...
 
-if __name__ == '__main__':
-    import sys
+    Plain HTML files print the title and body.  WARC (.warc, .warc.gz) and
+    one-document-per-line archives are streamed record by record through a
+    pool of extraction processes and written to stdout as JSON lines.  With
+    --dedup a body that is a near-duplicate of one seen before, in this run
+    or an earlier one using the same index file, gets "duplicate_of": url.
+
+    python -m boilerpot serve --help for the HTTP service.
+"""
+import collections
+import json
+import optparse
+import sys
 
-    for fname in sys.argv[1:]:
+from .boilerpot import extract_text
+from .batch import extract_many
+from . import archives
+from .dedup import DuplicateIndex
+
+def print_text(fnames, parser=None):
+    for fname in fnames:
         f = (sys.stdin if (fname == '-') else open(fname))
         with f:
-            title, body = extract_text(f.read())
+            title, body = extract_text(f.read(), parser)
         print title
         print body
+
+def write_jsonl(fnames, format=None, workers=None, timeout=None, parser=None, dedup=None, out=sys.stdout):
+    urls = collections.deque()
+    def docs():
+        # read and decompressed in the pool's task thread while the workers extract
+        for fname in fnames:
+            for url, headers, html in archives.iter_records(fname, format):
+                urls.append(url)
+                yield html, headers
+
+    for result in extract_many(docs(), workers=workers, chunksize=4, timeout=timeout, parser=parser):
+        record = {'url': urls.popleft(),
+                  'title': result.title,
+                  'body': result.body,
+                  'seconds': round(result.seconds, 6),
+                  }
+        if result.error:
+            record['error'] = result.error
+        elif dedup is not None and record['url']:
+            original = dedup.add(record['url'], result.body)
+            if original is not None:
+                record['duplicate_of'] = original
+        out.write(json.dumps(record) + '\n')
+
+def main(argv):
+    if argv[:1] == ['serve']:
+        from . import server
+        return server.main(argv[1:])
+    usage = __doc__.splitlines()[0].strip()
+    op = optparse.OptionParser(usage=usage)
+    op.add_option('-f', '--format', choices=sorted(archives.readers),
+                  help='input format: html, warc or lines (default: guess from the file name)')
+    op.add_option('--json', action='store_true', help='write JSON lines even for plain HTML')
+    op.add_option('-j', '--workers', type='int', help='extraction processes (default: one per CPU)')
+    op.add_option('-t', '--timeout', type='float', help='give up on a document after this many seconds')
+    op.add_option('-p', '--parser', help='parser backend to use')
+    op.add_option('--dedup', metavar='FILE', help='near-duplicate index to check the bodies against and add them to')
+    options, fnames = op.parse_args(argv)
+    if not fnames:
+        op.error('no input files')
+
+    formats = set(options.format or archives.guess_format(fname) for fname in fnames)
+    if formats == set(['html']) and not (options.json or options.dedup):
+        print_text(fnames, options.parser)
+    else:
+        dedup = DuplicateIndex(options.dedup) if options.dedup else None
+        write_jsonl(fnames, options.format, options.workers, options.timeout, options.parser, dedup)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,104 @@
+"""
+ Copyright Curata, Inc c/o Jack Diederich
+
+ The author licenses this file to You under the Apache License, Version 2.0
+ (the "License"); you may not use this file except in compliance with
+ the License.  You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ Readers for crawl archives.  Each yields (url, headers, html) one record at a
+ time so a multi-GB archive never has to fit in memory.  headers are the HTTP
+ response headers with lowercase names, ready to hand to decode_data().
+"""
+import gzip
+import sys
+
+def open_archive(fname):
+    if fname == '-':
+        return sys.stdin
+    if fname.endswith('.gz'):
+        # reads across gzip members, which is how .warc.gz is laid out
+        return gzip.open(fname, 'rb')
+    return open(fname, 'rb')
+
+def read_headers(f):
+    """ read "Name: value" lines up to the next blank line """
+    headers = {}
+    for line in iter(f.readline, ''):
+        line = line.rstrip('\r\n')
+        if not line:
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return headers
+
+def split_http(block):
+    """ split an HTTP response into (headers, body) """
+    head, _, body = block.partition('\r\n\r\n')
+    headers = {}
+    for line in head.split('\r\n')[1:]:  # skip the status line
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return headers, body
+
+def iter_warc(f):
+    """ yield the HTML responses in a WARC file, everything else is skipped """
+    for line in iter(f.readline, ''):
+        if not line.strip():
+            continue  # blank lines between records
+        if not line.startswith('WARC/'):
+            raise ValueError('expected a WARC record, got %r' % line[:40])
+        warc = read_headers(f)
+        block = f.read(int(warc.get('content-length', 0)))
+        if warc.get('warc-type') != 'response' or \
+           not warc.get('content-type', '').startswith('application/http'):
+            continue
+        headers, body = split_http(block)
+        if 'html' not in headers.get('content-type', 'html'):
+            continue
+        yield warc.get('warc-target-uri'), headers, body
+
+def iter_lines(f):
+    """ one document per line, optionally "url<tab>html" """
+    for line in f:
+        line = line.rstrip('\r\n')
+        if not line:
+            continue
+        url = None
+        if not line.startswith('<'):
+            url, _, html = line.partition('\t')
+            if html:
+                line = html
+            else:
+                url = None
+        yield url, {}, line
+
+def iter_html(f):
+    """ the whole file is one document """
+    yield getattr(f, 'name', None), {}, f.read()
+
+readers = {}
+readers['html'] = iter_html
+readers['warc'] = iter_warc
+readers['lines'] = iter_lines
+
+def guess_format(fname):
+    name = fname[:-3] if fname.endswith('.gz') else fname
+    if name.endswith('.warc'):
+        return 'warc'
+    if name.endswith(('.lines', '.txt', '.ndhtml')):
+        return 'lines'
+    return 'html'
+
+def iter_records(fname, format=None):
+    format = format or guess_format(fname)
+    with open_archive(fname) as f:
+        for record in readers[format](f):
+            yield record
@@ -0,0 +1,122 @@
+"""
+ Copyright Curata, Inc c/o Jack Diederich
+
+ The author licenses this file to You under the Apache License, Version 2.0
+ (the "License"); you may not use this file except in compliance with
+ the License.  You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+import collections
+import signal
+import threading
+import time
+
+from .boilerpot import Budget, calling_libxml, extract_text
+
+Result = collections.namedtuple('Result', 'index title body error seconds')
+
+class Timeout(Exception):
+    pass
+
+def _alarm(signum, frame):
+    feeder = calling_libxml(frame)
+    if feeder is not None:
+        # not from in there, stop the parse and go off again once it lets go
+        feeder.stop('timeout')
+        signal.setitimer(signal.ITIMER_REAL, 0.01)
+        return
+    raise Timeout('extraction took too long')
+
+def _timed_out(budget):
+    # the alarm stopped the parse, whatever came of it is half a page
+    if budget is not None and budget.truncated == 'timeout':
+        raise Timeout('extraction took too long')
+
+_cache = None
+
+def _init_worker(cache=None):
+    global _cache
+    # the parent handles ^C and tears the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGALRM, _alarm)
+    _cache = cache
+
+def _extract(task):
+    """ the Result, and the cache hits and misses it took """
+    index, html, headers, parser, timeout = task
+    start = time.time()
+    looked_up = (_cache.hits, _cache.misses) if _cache is not None else (0, 0)
+    # a Budget gets lxml a target _alarm can stop
+    budget = Budget(stop_at_end=False) if timeout else None
+    try:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            if _cache is not None:
+                title, body = _cache.extract_text(html, parser, headers, budget)
+            else:
+                title, body = extract_text(html, parser, headers, budget=budget)
+        finally:
+            if timeout:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        _timed_out(budget)
+    except Exception, e:
+        error = '%s: %s' % (e.__class__.__name__, e)
+        result = Result(index, u'', u'', error, time.time() - start)
+    else:
+        result = Result(index, title, body, None, time.time() - start)
+    if _cache is None:
+        return result, (0, 0)
+    return result, (_cache.hits - looked_up[0], _cache.misses - looked_up[1])
+
+def extract_many(docs, workers=None, chunksize=1, ordered=True, timeout=None, parser=None, cache=None):
+    """ run extract_text over an iterable of HTML documents in a pool of worker
+        processes and yield a Result(index, title, body, error, seconds) for
+        each one.  A document can also be an (html, headers) pair.
+
+        Results come back in input order, or as they finish if ordered=False
+        (use index to line them up).  A document that raises, or runs longer
+        than timeout seconds, comes back with error set instead of stopping
+        the batch.  Workers stay up for the whole batch and only a few chunks
+        per worker are read ahead of the results, so docs can be a generator
+        over a corpus that doesn't fit in memory.  cache is an ExtractionCache,
+        every worker gets its own copy of the settings and shares the disk part,
+        their hits and misses are added up in cache.
+    """
+    import multiprocessing  # not worth the import time for a single page
+    workers = workers or multiprocessing.cpu_count()
+    window = threading.Semaphore(2 * workers * chunksize)
+    stopped = threading.Event()
+    def feed():
+        # runs in the pool's task thread
+        for index, doc in enumerate(docs):
+            html, headers = doc if isinstance(doc, tuple) else (doc, None)
+            window.acquire()
+            if stopped.is_set():
+                return
+            yield index, html, headers, parser, timeout
+
+    pool = multiprocessing.Pool(workers, _init_worker, (cache,))
+    try:
+        mapper = pool.imap if ordered else pool.imap_unordered
+        for result, (hits, misses) in mapper(_extract, feed(), chunksize):
+            window.release()
+            if cache is not None:
+                cache.hits += hits
+                cache.misses += misses
+            yield result
+    finally:
+        # terminate() waits for the task thread, which may be waiting in
+        # feed() for a result nobody is going to take (a break, an
+        # exception, ^C)
+        stopped.set()
+        window.release()
+        pool.terminate()
+        pool.join()
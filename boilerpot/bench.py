@@ -0,0 +1,248 @@
+"""
+ Copyright Curata, Inc c/o Jack Diederich
+
+ The author licenses this file to You under the Apache License, Version 2.0
+ (the "License"); you may not use this file except in compliance with
+ the License.  You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ python -m boilerpot.bench [options] CORPUS_DIR
+
+ Speed and accuracy over a directory of pages.  Every NAME.html (or .htm)
+ is extracted with each function and parser backend; if NAME.txt exists
+ (in the corpus directory or --gold) it is the gold text and the bag of
+ words of the output is scored against it.  CleanEval gold files work as
+ they are, the URL: line and the <p>/<h>/<l> markers are skipped.
+
+ Each function/parser pair runs in a fresh process so the peak RSS is its
+ own.  --json saves everything, to diff one run against another.
+
+ python -m boilerpot.bench --startup
+
+ Times a fresh interpreter importing boilerpot and running the command line
+ tool on one small page, and exits 1 if either is over startup_budget.  The
+ heavy optional imports (BeautifulSoup, lxml, multiprocessing, sqlite3) wait
+ until something uses them, this is what keeps them that way.
+"""
+import collections
+import glob
+import json
+import multiprocessing
+import optparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+from . import boilerpot
+from .trace import Tracer, tracing, maxrss
+
+functions = ['meat', 'meat2', 'extract_text']
+
+# seconds on top of starting the interpreter.  The command line is meant to
+# start in tens of milliseconds; both are about half again what they take on
+# a quiet machine, importing BeautifulSoup up front (60ms) goes over either
+startup_budget = {'import': 0.04, 'command line': 0.08}
+
+gold_markup_re = re.compile(r'^URL:.*$|<[phl]>', re.MULTILINE | re.IGNORECASE)
+
+def tokens(text):
+    return collections.Counter(boilerpot.word_re.findall(text.lower()))
+
+def read_gold(fname):
+    with open(fname, 'rb') as f:
+        text = boilerpot.decode_data(f.read())
+    return gold_markup_re.sub(u' ', text)
+
+def find_corpus(path, gold_dir=None):
+    """ [(name, html file, gold file or None)] """
+    docs = []
+    for fname in sorted(glob.glob(os.path.join(path, '*.htm')) + glob.glob(os.path.join(path, '*.html'))):
+        name = os.path.splitext(os.path.basename(fname))[0]
+        gold = os.path.join(gold_dir or path, name + '.txt')
+        docs.append((name, fname, gold if os.path.exists(gold) else None))
+    return docs
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(pct / 100.0 * len(values)))]
+
+def run(func_name, parser, docs, repeat=1):
+    """ one function/parser pair over the whole corpus """
+    warnings.simplefilter('ignore')
+    func = getattr(boilerpot, func_name)
+    pages = []
+    for name, fname, gold in docs:
+        with open(fname, 'rb') as f:
+            data = f.read()
+        pages.append((name, data, read_gold(gold) if gold else None))
+
+    tracer = Tracer()
+    latency = []
+    stage_times = collections.defaultdict(list)
+    found = expected = matched = 0
+    errors = {}
+    start = time.time()
+    with tracing(tracer):
+        for name, data, gold in pages:
+            for i in range(repeat):
+                doc_start = time.time()
+                tracer.begin()
+                try:
+                    if func_name == 'extract_text':
+                        title, body = func(data, parser)
+                    else:
+                        title, body = func(boilerpot.timed('decode', boilerpot.decode_data, data), parser)
+                except Exception, e:
+                    errors[name] = '%s: %s' % (e.__class__.__name__, e)
+                    title, body = u'', u''
+                latency.append(time.time() - doc_start)
+                per_stage = collections.defaultdict(float)
+                for stage, seconds, blocks, rss in tracer.stages:
+                    per_stage[stage] += seconds
+                for stage, seconds in per_stage.items():
+                    stage_times[stage].append(seconds)
+            if gold is not None:
+                got, want = tokens(body), tokens(gold)
+                found += sum(got.values())
+                expected += sum(want.values())
+                matched += sum((got & want).values())
+    seconds = time.time() - start
+
+    count = len(pages) * repeat
+    size = sum(len(data) for name, data, gold in pages) * repeat
+    result = {'function': func_name,
+              'parser': parser,
+              'docs': count,
+              'seconds': seconds,
+              'docs_per_sec': count / seconds if seconds else 0.0,
+              'mb_per_sec': size / seconds / (1 << 20) if seconds else 0.0,
+              'latency': {'p50': percentile(latency, 50), 'p99': percentile(latency, 99)},
+              'stages': dict((stage, {'p50': percentile(times, 50), 'p99': percentile(times, 99),
+                                      'total': sum(times)})
+                             for stage, times in stage_times.items()),
+              'peak_rss_kb': maxrss(),
+              'errors': errors,
+              }
+    if expected:
+        precision = float(matched) / found if found else 0.0
+        recall = float(matched) / expected
+        f1 = 2 * precision * recall / (precision + recall) if matched else 0.0
+        result.update(precision=precision, recall=recall, f1=f1)
+    return result
+
+def _run(args):
+    return run(*args)
+
+def bench(docs, funcs=functions, parsers=None, repeat=1):
+    results = []
+    for parser in parsers or sorted(boilerpot.parsers):
+        for func_name in funcs:
+            pool = multiprocessing.Pool(1)
+            try:
+                results.append(pool.apply(_run, ((func_name, parser, docs, repeat),)))
+            finally:
+                pool.terminate()
+                pool.join()
+    return results
+
+def report(results, out=sys.stdout):
+    header = '%-14s %-16s %8s %8s %9s %9s %9s %6s %6s %6s' % (
+        'function', 'parser', 'docs/s', 'MB/s', 'p50 ms', 'p99 ms', 'rss MB', 'P', 'R', 'F1')
+    out.write(header + '\n')
+    for r in results:
+        scores = ['%6.3f' % r[key] if key in r else '%6s' % '-' for key in ['precision', 'recall', 'f1']]
+        out.write('%-14s %-16s %8.1f %8.2f %9.2f %9.2f %9.1f %s\n' % (
+            r['function'], r['parser'], r['docs_per_sec'], r['mb_per_sec'],
+            r['latency']['p50'] * 1000, r['latency']['p99'] * 1000,
+            r['peak_rss_kb'] / 1024.0, ' '.join(scores)))
+        if r['errors']:
+            out.write('    %d errors, eg %s\n' % (len(r['errors']), sorted(r['errors'].items())[0]))
+
+def report_stages(results, out=sys.stdout):
+    for r in results:
+        out.write('\n%s %s\n' % (r['function'], r['parser']))
+        for stage, times in sorted(r['stages'].items(), key=lambda item: -item[1]['total']):
+            out.write('    %-40s p50 %8.3fms  p99 %8.3fms\n' % (stage, times['p50'] * 1000, times['p99'] * 1000))
+
+small_page = '<html><head><title>Cold start</title></head><body><p>%s</p></body></html>' % ('Some text. ' * 40)
+
+def environ():
+    """ os.environ for a child python that imports the boilerpot being
+        benchmarked, not whichever one is installed
+    """
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [here, os.environ.get('PYTHONPATH')])))
+
+def wall_time(args, repeat):
+    env = environ()
+    best = None
+    with open(os.devnull, 'wb') as devnull:
+        for i in range(repeat):
+            start = time.time()
+            subprocess.check_call(args, stdout=devnull, env=env)
+            seconds = time.time() - start
+            best = seconds if best is None else min(best, seconds)
+    return best
+
+def startup(repeat=5):
+    """ {what: best of repeat seconds} for a cold import and a cold run of
+        python -m boilerpot, less the time python takes to start at all
+    """
+    python = [sys.executable]
+    base = wall_time(python + ['-c', 'pass'], repeat)
+    with tempfile.NamedTemporaryFile(suffix='.html') as f:
+        f.write(small_page)
+        f.flush()
+        times = {'import': wall_time(python + ['-c', 'import boilerpot'], repeat),
+                 'command line': wall_time(python + ['-m', 'boilerpot', f.name], repeat)}
+    return dict((what, max(seconds - base, 0.0)) for what, seconds in times.items())
+
+def main(argv):
+    op = optparse.OptionParser(usage='python -m boilerpot.bench [options] CORPUS_DIR')
+    op.add_option('-g', '--gold', help='directory with the NAME.txt gold files (default: CORPUS_DIR)')
+    op.add_option('-f', '--function', action='append', choices=functions,
+                  help='function to run, can be repeated (default: all)')
+    op.add_option('-p', '--parser', action='append', choices=sorted(boilerpot.parsers),
+                  help='parser backend to run, can be repeated (default: all installed)')
+    op.add_option('-r', '--repeat', type='int', default=1, help='extract each page this many times')
+    op.add_option('--stages', action='store_true', help='print p50/p99 for every stage too')
+    op.add_option('--json', help='save the results to this file')
+    op.add_option('--startup', action='store_true', help='check the cold start times against startup_budget')
+    options, args = op.parse_args(argv)
+    if options.startup:
+        over = False
+        for what, seconds in sorted(startup().items()):
+            budget = startup_budget[what]
+            over = over or seconds > budget
+            print '%-14s %8.1fms  (budget %.0fms)' % (what, seconds * 1000, budget * 1000)
+        sys.exit(1 if over else 0)
+    if len(args) != 1:
+        op.error('one corpus directory please')
+
+    docs = find_corpus(args[0], options.gold)
+    if not docs:
+        op.error('no .html files in %s' % args[0])
+    results = bench(docs, options.function or functions, options.parser, options.repeat)
+    report(results)
+    if options.stages:
+        report_stages(results)
+    if options.json:
+        with open(options.json, 'wb') as f:
+            json.dump({'version': boilerpot.__version__, 'corpus': os.path.abspath(args[0]),
+                       'results': results}, f, indent=1, sort_keys=True)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -20,16 +20,51 @@
 
 __version__ = '0.92'
 
+import codecs
+import functools
+import imp
 import re
-try:
-    from bs4 import BeautifulSoup as BS, Tag, Comment
-    bs_version = 4
-except ImportError:
-    from BeautifulSoup import BeautifulSoup as BS, Tag, Comment
-    bs_version = 3
+import threading
+import time
+import zlib
+from htmlentitydefs import name2codepoint
+from HTMLParser import HTMLParser
 
 from . import cleaners
 
+def installed(name):
+    """ whether a module is there to import, without importing it """
+    path = None
+    for part in name.split('.'):
+        try:
+            f, path, description = imp.find_module(part, path and [path])
+        except ImportError:
+            return False
+        if f:
+            f.close()
+    return True
+
+# BeautifulSoup and lxml take longer to import than most pages take to
+# extract, they are loaded the first time a parser needs them
+bs_version = 4 if installed('bs4') else 3 if installed('BeautifulSoup') else None
+BS = Tag = Comment = None
+etree = None
+
+def load_soup():
+    global BS, Tag, Comment
+    if BS is None:
+        if bs_version == 4:
+            from bs4 import BeautifulSoup as BS, Tag, Comment
+        else:
+            from BeautifulSoup import BeautifulSoup as BS, Tag, Comment
+    return BS
+
+def load_etree():
+    global etree
+    if etree is None:
+        from lxml import etree
+    return etree
+
 actions = {}
 actions['a'] = 'anchor'
 actions['body'] = 'body'
@@ -66,79 +101,415 @@ def apply_font(start, txt):
             pass
     return start
 
+word_re = re.compile('\w+')
+
+class label(object):
+    """ bits for Text.flags """
+    content = 1 << 0
+    ignore = 1 << 1
+    maybe_content = 1 << 2
+    likely_content = 1 << 3
+    title = 1 << 4
+    heading = 1 << 5
+    end_of_text = 1 << 6
+    # the block level tags from the blocks list
+    li = 1 << 7
+    h1 = 1 << 8
+    h2 = 1 << 9
+    h3 = 1 << 10
+
+label_names = dict((value, name) for name, value in vars(label).items() if isinstance(value, int))
+
+# record why each label was added or taken away (eg 'content_largest_block')
+# in Text.why.  Handy when debugging a filter, too slow to leave on.
+provenance = False
+
 def wc(text):
-    return len(filter(None, re.split('\w+', text)))
+    return len(filter(None, word_re.split(text)))
+
+class Document(object):
+    """ the normalized text of a page, every block's text one after the other
+        with a space in between.  Blocks hold (start, end) spans into it and
+        only make a string when somebody asks for their text.
+    """
+    def __init__(self):
+        self.chunks = []
+        self.length = 0
+        self.last = (0, u'')
+
+    def append(self, text):
+        """ add a block's text, returns its span """
+        start = self.length
+        self.chunks.append(text)
+        self.chunks.append(u' ')
+        self.length += len(text) + 1
+        self.last = (start, text)
+        return start, start + len(text)
+
+    @property
+    def text(self):
+        if len(self.chunks) != 1:
+            self.chunks = [u''.join(self.chunks)]
+            self.last = (0, self.chunks[0])
+        return self.chunks[0]
+
+    def slice(self, start, end):
+        # the parser looks at each block as it is added, that doesn't need
+        # the whole document joined up yet
+        begin, text = self.last
+        if begin <= start and end - begin <= len(text):
+            return text[start - begin:end - begin]
+        return self.text[start:end]
+
+class Path(object):
+    """ a block's tags (or ids) from the outside in, read it like a tuple.
+        Each one is the Path it was opened inside plus a name, so the blocks
+        share what they have in common instead of each copying the lot,
+        which goes quadratic on a page nested thousands deep.
+    """
+    __slots__ = ['name', 'parent', 'length']
+
+    def __init__(self, name=None, parent=None):
+        self.name = name
+        self.parent = parent
+        self.length = parent.length + 1 if parent is not None else 0
+
+    def names(self):
+        names = []
+        node = self
+        while node.length:
+            names.append(node.name)
+            node = node.parent
+        names.reverse()
+        return names
+
+    @classmethod
+    def of(cls, names):
+        path = cls()
+        for name in names:
+            path = cls(name, path)
+        return path
+
+    def count(self, name):
+        return self.names().count(name)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return iter(self.names())
+
+    def __getitem__(self, index):
+        return self.names()[index]
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        try:
+            return self.names() == list(other)
+        except TypeError:
+            return False
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(tuple(self.names()))
+
+    def __repr__(self):
+        return repr(self.names())
 
 class Text(object):
-    def __init__(self, text='', depth=0, ignore=0, tags=[], ids=[]):
-        self.text = cleaners.clean_html(text)
+    __slots__ = ['doc', 'spans', 'length', 'depth', 'ignore', 'tags', 'ids', 'flags', 'why', 'anchors',
+                 'wordcount', 'linecount', 'link_density', 'word_density', 'lead', 'trail']
+
+    def __init__(self, text='', depth=0, ignore=0, tags=[], ids=[], doc=None, anchors=None):
+        self.doc = doc or Document()
+        self.spans = [self.doc.append(cleaners.clean_html(text))]
         self.depth = depth
         self.ignore = ignore
         self.tags = tags
         self.ids = ids
-        self.labels = set()
+        self.anchors = tags.count('a') if anchors is None else anchors
+        self.flags = 0
+        self.why = None
         self.wordcount = 0
         self.linecount = 0
         self.link_density = 0
         self.word_density = 0
         self.recalc()
 
+    @property
+    def text(self):
+        # merges only add spans, the string is made when somebody looks
+        doc = self.doc
+        if len(self.spans) == 1:
+            return doc.slice(*self.spans[0])
+        return u' '.join([doc.slice(start, end) for start, end in self.spans])
+
+    @text.setter
+    def text(self, text):
+        self.doc = Document()
+        self.spans = [self.doc.append(text)]
+        self.recalc()
+
     def recalc(self):
-        self.wordcount = wc(self.text)
-        self.linecount = self.text.count('\n') + 1
+        text = self.text
+        # wc() counts the bits between words, keep track of whether there are
+        # any at the ends so merge() knows when two of them join up
+        between = word_re.split(text)
+        self.wordcount = len(filter(None, between))
+        self.lead = bool(between[0])
+        self.trail = bool(between[-1])
+        self.length = len(text)
+        self.linecount = text.count('\n') + 1
+        self.densities()
+
+    def densities(self):
         if self.wordcount:
             self.word_density = float(self.wordcount) / self.linecount
-        if 'a' in self.tags:
-            self.link_density = float(self.wordcount) / self.tags.count('a')  # not what initDesities() measures exactly
+        if self.anchors:
+            self.link_density = float(self.wordcount) / self.anchors  # not what initDesities() measures exactly
 
     def merge(self, other):
-        self.text += ' ' + other.text
-        self.labels |= other.labels
-        self.recalc()
+        """ the same as self.text += ' ' + other.text, but the counts are added
+            up instead of redone over the whole text
+        """
+        if other.doc is not self.doc:
+            # the blank Text() a rule starts out with
+            text = self.text + u' ' + other.text
+            self.doc = Document()
+            self.spans = [self.doc.append(text)]
+        else:
+            start, end = other.spans[0]
+            if start == self.spans[-1][1] + 1:
+                # the next block along, the space between them is already there
+                self.spans[-1] = (self.spans[-1][0], end)
+                self.spans.extend(other.spans[1:])
+            else:
+                self.spans.extend(other.spans)
+        self.wordcount += other.wordcount + 1 - self.trail - other.lead
+        self.lead = self.lead if self.length else True
+        self.trail = other.trail if other.length else True
+        self.length += 1 + other.length
+        self.linecount += other.linecount - 1
+        self.flags |= other.flags
+        if other.why:
+            self.why = (self.why or set()) | other.why
+        self.densities()
+
+    def mark(self, flags, why=None):
+        self.flags |= flags
+        if provenance and why:
+            self.note(why)
+
+    def unmark(self, flags, why=None):
+        self.flags &= ~flags
+        if provenance and why:
+            self.note(why)
+
+    def note(self, why):
+        if provenance:
+            if self.why is None:
+                self.why = set()
+            self.why.add(why)
+
+    def copy(self):
+        """ a Text the rules can change without touching this one """
+        other = Text.__new__(Text)
+        other.doc = self.doc
+        other.spans = self.spans[:]
+        other.length = self.length
+        other.depth = self.depth
+        other.ignore = self.ignore
+        other.tags = self.tags
+        other.ids = self.ids
+        other.flags = self.flags
+        other.why = set(self.why) if self.why else None
+        other.anchors = self.anchors
+        other.wordcount = self.wordcount
+        other.linecount = self.linecount
+        other.link_density = self.link_density
+        other.word_density = self.word_density
+        other.lead = self.lead
+        other.trail = self.trail
+        return other
+
+    @property
+    def labels(self):
+        """ the flags, and the notes if provenance is on, as a set of strings """
+        names = set(name for value, name in label_names.items() if self.flags & value)
+        return frozenset(names | (self.why or set()))
 
     @property
     def is_content(self):
-        return 'content' in self.labels and 'ignore' not in self.labels
+        return self.flags & (label.content | label.ignore) == label.content
 
     def __len__(self):
-        return len(self.text)
+        return self.length
 
     def __repr__(self):
         return '<%s depth=%d ignore=%d tags=%r ids=%r labels=%r text=%r>' % (self.__class__.__name__, self.depth, self.ignore, self.tags, self.ids, self.labels, self.text)
 
+# print what the parser and the rules are doing, very noisy
+debug = False
+
 def log(msg):
-    #print msg
-    return
+    print msg
+
+class Traced(threading.local):
+    """ traced.tracer is the trace.Tracer timing each stage, see
+        trace.tracing().  Every thread installs its own, so the pages the
+        server extracts in a thread per request don't time into each other.
+    """
+    tracer = None
+traced = Traced()
+
+def timed(stage, func, *args):
+    tracer = traced.tracer
+    if tracer is None:
+        return func(*args)
+    return tracer.call(stage, func, *args)
+
+class StopParsing(Exception):
+    pass
+
+class Budget(object):
+    """ opt-in limits on how much of a page gets parsed, for pages with
+        megabytes of comments or worse.
+          stop_at_end  stop at the first end-of-text block ("post a comment",
+                       "reader comments", ...) once minwords words of content
+                       have gone by.  Content is what content_marker would
+                       call it, so a cookie banner or a byline doesn't count.
+                       The end-of-text blocks are marked for
+                       ignore_after_content either way
+          max_chars    only parse this much of the decoded page
+          max_blocks   stop after this many blocks
+          max_seconds  CPU seconds for the page from the start of the parse.
+                       Past it the parse stops and extract_text() skips the
+                       filters for largest_paragraph().  The clock is checked
+                       on every block and every 256 start tags.  The
+                       BeautifulSoup backends build the whole tree before
+                       the first one, that part can't be cut short
+          clock        time.clock by default, which is CPU time for the whole
+                       process.  Pass time.time when other threads are
+                       extracting too, the limit is wall time then
+        truncated is why the last page parsed with this budget was cut short,
+        or None.  It is on the page returned by the filters too.  degraded
+        says the last page ran out of time and got largest_paragraph().
+    """
+    def __init__(self, stop_at_end=True, minwords=60, max_chars=None, max_blocks=None, max_seconds=None,
+                 clock=None):
+        self.stop_at_end = stop_at_end
+        self.minwords = minwords
+        self.max_chars = max_chars
+        self.max_blocks = max_blocks
+        self.max_seconds = max_seconds
+        self.clock = clock or time.clock
+        self.truncated = None
+        self.degraded = False
+        self.deadline = None
+        self.ticks = 0
+
+    def start(self):
+        """ a new page """
+        self.truncated = None
+        self.degraded = False
+        self.deadline = self.clock() + self.max_seconds if self.max_seconds else None
+
+    def over(self):
+        """ out of time """
+        return self.deadline is not None and self.clock() > self.deadline
+
+    def check(self, state, block):
+        """ called on each new block, raises StopParsing when it's time """
+        if self.stop_at_end and not block.ignore:
+            self.count_content(state, block)
+            if is_end_of_text(block):
+                block.mark(label.end_of_text, 'end_of_text_budget')
+                if state.words > self.minwords:
+                    self.stop(state, 'end_of_text')
+        if self.max_blocks and len(state.parts) >= self.max_blocks:
+            self.stop(state, 'max_blocks')
+        if self.deadline is not None and self.clock() > self.deadline:
+            self.stop(state, 'max_seconds')
+
+    def tick(self, state):
+        """ called on each start tag, for pages that go a long way between
+            blocks
+        """
+        self.ticks += 1
+        if self.deadline is not None and not self.ticks & 0xff and self.clock() > self.deadline:
+            self.stop(state, 'max_seconds')
+
+    def count_content(self, state, block):
+        """ content_marker's first two tests on the block before this one, now
+            that its next is known, adding its words to state.words if it
+            passes
+        """
+        prev, curr = state.recent
+        if curr is not None and curr.link_density <= 0.333333:
+            if prev is None or prev.link_density <= 0.555556:
+                prev_words = prev.wordcount if prev is not None else 0
+                content = curr.wordcount > 16 and block.wordcount > 15 and prev_words > 4
+            else:
+                content = curr.wordcount > 40 and block.wordcount > 17
+            if content:
+                state.words += curr.wordcount
+        state.recent = curr, block
+
+    def stop(self, state, why):
+        # lxml can hand over a few more events before it stops
+        state.truncated = why
+        state.stopped = True
+        raise StopParsing(why)
 
 class ParseState(object):
-    def __init__(self):
+    def __init__(self, budget=None):
+        self.budget = budget
+        self.truncated = None
+        self.degraded = False
+        self.stopped = False
+        self.words = 0
+        self.recent = None, None  # the last two blocks Budget.check() saw
         self.parts = []
         self.title = u''
-        self.curr_text = u''
-        self.curr_ids = []
+        self.doc = Document()
+        self.curr_text = []
         self.tags = []
+        # self.tags again and the ids that go with them, for the blocks
+        self.path = Path()
+        self.curr_ids = Path()
         self.ignore_depth = 0
         self.anchor_depth = 0
         self.body_depth = 0
         self.font_sizes = [3]
 
 
-    def flush(self, *labels):
-        curr = self.curr_text.strip()
-        if curr:
-            self.parts.append(Text(self.curr_text, len(self.tags) + 1, self.ignore_depth, self.tags[:], self.curr_ids[:]))
-            self.parts[-1].labels |= set(labels)
-            log(self.parts[-1])
-        self.curr_text = u''
+    def flush(self, flags=0, why=None):
+        text = u''.join(self.curr_text)
+        if text.strip() and not self.stopped:
+            self.parts.append(Text(text, len(self.tags) + 1, self.ignore_depth, self.path, self.curr_ids, self.doc,
+                                   self.anchor_depth))
+            self.parts[-1].mark(flags, why)
+            if debug:
+                log(self.parts[-1])
+            if self.budget is not None:
+                self.budget.check(self, self.parts[-1])
+        self.curr_text = []
 
     def tag_start(self, name, attr):
-        log('%s START %s %r %r' % ('  ' * len(self.tags), name, self.tags, type(attr)))
+        if debug:
+            log('%s START %s %r %r' % ('  ' * len(self.tags), name, self.tags, type(attr)))
+        if self.budget is not None:
+            self.budget.tick(self)
         action = actions.get(name, None)
         self.tags.append(name)
+        self.path = Path(name, self.path)
         try:
-            self.curr_ids.append(attr['id'])
+            self.curr_ids = Path(attr['id'], self.curr_ids)
         except KeyError:
-            self.curr_ids.append('')
+            self.curr_ids = Path('', self.curr_ids)
         if action == 'anchor':
             self.anchor_depth += 1
             assert self.anchor_depth == 1, "Anchor tags can't be nested"
@@ -149,7 +520,7 @@ class ParseState(object):
             self.flush()
             self.body_depth += 1
         elif action == 'inline':
-            self.curr_text = self.curr_text.strip(' ') + u' '
+            self.curr_text = [u''.join(self.curr_text).strip(' '), u' ']
             if name == 'font':
                 self.font_sizes.append(apply_font(self.font_sizes[-1], attr.get('size', None)))
         elif action == 'block':
@@ -159,25 +530,28 @@ class ParseState(object):
         elif action == 'title':
             self.flush()
         else:
-            log('%s BAD %s %s' % ('  ' * len(self.tags), action, name))
+            if debug:
+                log('%s BAD %s %s' % ('  ' * len(self.tags), action, name))
             self.flush()
             return
 
     def characters(self, text):
-        log('%s   TEXT %r' % ('  ' * len(self.tags), text))
+        if debug:
+            log('%s   TEXT %r' % ('  ' * len(self.tags), text))
         if text.strip().startswith('html PUBLIC'):  # hell no
-            self.curr_text = u''
+            self.curr_text = []
             return
         if self.tags[-1] in {'b', 'em', 'i', 'strong'}:
             if wc(text) > 5:
                 self.flush()
-                self.curr_text += unicode(text)
-                self.flush('ignore', 'ignore_inline_' + self.tags[-1])
+                self.curr_text.append(unicode(text))
+                self.flush(label.ignore, 'ignore_inline_' + self.tags[-1])
                 return
-        self.curr_text += unicode(text)
+        self.curr_text.append(unicode(text))
 
     def tag_end(self, name):
-        log('%s END %s' % ('  ' * len(self.tags), name))
+        if debug:
+            log('%s END %s' % ('  ' * len(self.tags), name))
         action = actions.get(name, None)
         if action == 'anchor':
             self.anchor_depth -= 1
@@ -188,102 +562,699 @@ class ParseState(object):
             self.flush()
             self.body_depth -= 1
         elif action == 'inline':
-            self.curr_text = self.curr_text.strip() + u' '
+            self.curr_text = [u''.join(self.curr_text).strip(), u' ']
             if name == 'font':
                 self.font_sizes.pop()
         elif action == 'block':
-            self.flush(name, 'heading')
+            self.flush(getattr(label, name) | label.heading)
         elif action == 'paragraph':
-            self.flush('maybe_content', 'maybe_content_paragraph')
+            self.flush(label.maybe_content, 'maybe_content_paragraph')
         elif action == 'title':
-            self.flush('title')
+            self.flush(label.title)
             self.title = title_cleaner(self.parts[-1].text)
         else:
             self.flush()
         assert name == self.tags.pop()
-        self.curr_ids.pop()
+        self.path = self.path.parent
+        self.curr_ids = self.curr_ids.parent
+
+    def copy(self):
+        """ a page with its own copy of the blocks, for running another filter """
+        other = ParseState.__new__(ParseState)
+        other.__dict__.update(self.__dict__)
+        other.parts = [part.copy() for part in self.parts]
+        blocks = getattr(self, 'blocks', None)
+        if blocks is self.parts:
+            other.blocks = other.parts
+        elif blocks is not None:
+            copies = dict(zip(map(id, self.parts), other.parts))
+            other.blocks = [copies[id(block)] for block in blocks]
+        return other
 
     def __str__(self):
         return '<%s %d:%r>' % (self.__class__.__name__, len(self.parts), map(len, self.parts))
         #return '<%s %d:%r>' % (self.__class__.__name__, len(self.parts), [p.text for p in self.parts])
 
 def descend(node, state):
+    """ walk a BeautifulSoup tree into state.  The open tags are kept on a
+        list rather than the call stack, so there's no limit on how deeply
+        a page can nest.
+    """
     state.tag_start(node.name.lower(), node)
-    for child in node.childGenerator():
-        if isinstance(child, Tag):
-            descend(child, state)
-        elif not isinstance(child, Comment):
-            state.characters(unicode(child))
-    state.tag_end(node.name.lower())
-
-def soup(html):
+    stack = [(node, node.childGenerator())]
+    while stack:
+        node, children = stack[-1]
+        for child in children:
+            if isinstance(child, Tag):
+                state.tag_start(child.name.lower(), child)
+                stack.append((child, child.childGenerator()))
+                break
+            elif not isinstance(child, Comment):
+                state.characters(unicode(child))
+        else:
+            stack.pop()
+            state.tag_end(node.name.lower())
+
+def soup(html, features=None):
+    load_soup()
     if bs_version == 3:
         return BS(html, convertEntities='html')
     else:
-        return BS(html)
-
-def parse_html(html):
-    html = cleaners.translate_microsoft(html)
-    html = cleaners.translate_nurses(html)
-    bs = soup(html)
-    state = ParseState()
-    descend(bs, state)
+        return BS(html, features)
+
+# tags that never have children, same list the bs4 html.parser builder uses
+void_tags = frozenset(['area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+                       'keygen', 'link', 'menuitem', 'meta', 'param', 'source', 'track',
+                       'wbr', 'basefont', 'bgsound', 'command', 'frame', 'image',
+                       'isindex', 'nextid', 'spacer'])
+preserve_whitespace = frozenset(['pre', 'textarea'])
+
+class TreeEvents(object):
+    """ turn a tokenizer's start/end/text events into ParseState calls without
+        building a tree.
+
+        Text is buffered so ParseState sees the same strings descend() would
+        have handed it, and end tags are patched up the way BeautifulSoup does
+        it: an end tag closes everything back to the most recent open tag of
+        that name (or is dropped if there isn't one) and anything still open at
+        the end of the document gets closed.
+    """
+    def __init__(self, state):
+        self.state = state
+        self.stack = []
+        self.pending = []
+        state.tag_start(u'[document]', {})
+
+    def text(self, data):
+        self.pending.append(data)
+
+    def end_text(self):
+        if not self.pending:
+            return
+        text = u''.join(self.pending)
+        self.pending = []
+        if not text.strip(' \t\n\r\f') and not preserve_whitespace.intersection(self.stack):
+            text = u'\n' if '\n' in text else u' '
+        self.state.characters(text)
+
+    def string(self, data):
+        """ a doctype/CDATA/processing instruction, descend() passes these through as text """
+        self.end_text()
+        self.pending.append(data)
+        self.end_text()
+
+    def start(self, tag, attrs):
+        self.end_text()
+        self.state.tag_start(tag, attrs)
+        self.stack.append(tag)
+
+    def end(self, tag):
+        self.end_text()
+        if tag not in self.stack:
+            return
+        while True:
+            name = self.stack.pop()
+            self.state.tag_end(name)
+            if name == tag:
+                break
+
+    def close(self):
+        self.end_text()
+        while self.stack:
+            self.state.tag_end(self.stack.pop())
+        self.state.tag_end(u'[document]')
+
+class StreamParser(HTMLParser):
+    """ drive a ParseState straight from the stdlib HTMLParser, recovering from
+        bad markup the same way BeautifulSoup's html.parser builder does.
+    """
+    def __init__(self, state):
+        HTMLParser.__init__(self)
+        self.events = TreeEvents(state)
+        self.closed_voids = []
+
+    def handle_starttag(self, tag, attrs, close_void=True):
+        self.events.start(tag, dict((k, v or '') for k, v in attrs))
+        if close_void and tag in void_tags:
+            self.events.end(tag)
+            # a later </br> for this <br> gets swallowed.  That includes the end
+            # event of a later <br/>, which leaves it open; bs4 does the same.
+            self.closed_voids.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, close_void=False)
+        self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.closed_voids:
+            self.closed_voids.remove(tag)
+        else:
+            self.events.end(tag)
+
+    def handle_data(self, data):
+        self.events.text(data)
+
+    def handle_charref(self, name):
+        if name[:1] in 'xX':
+            number = int(name[1:], 16)
+        else:
+            number = int(name)
+        text = None
+        if number < 256:
+            # people write &#150; meaning windows-1252, not unicode
+            try:
+                text = chr(number).decode('windows-1252')
+            except UnicodeError:
+                pass
+        if text is None:
+            try:
+                text = unichr(number)
+            except (ValueError, OverflowError):
+                text = u'\ufffd'
+        self.events.text(text)
+
+    def handle_entityref(self, name):
+        if name in name2codepoint:
+            self.events.text(unichr(name2codepoint[name]))
+        else:
+            self.events.text(u'&' + name)
+
+    def handle_comment(self, data):
+        self.events.end_text()
+
+    def handle_decl(self, data):
+        self.events.string(data[len('DOCTYPE '):])
+
+    def unknown_decl(self, data):
+        if data.upper().startswith('CDATA['):
+            data = data[len('CDATA['):]
+        self.events.string(data)
+
+    def handle_pi(self, data):
+        self.events.string(data)
+
+    def close(self):
+        HTMLParser.close(self)
+        self.events.close()
+
+class LxmlTarget(TreeEvents):
+    """ lxml parser target, libxml2 tokenizes and fixes up the nesting in C and
+        we never build the etree.  Same events as bs4 with the lxml builder.
+    """
+    def doctype(self, name, pubid, system):
+        doctype = name or u''
+        if pubid is not None:
+            doctype += u' PUBLIC "%s"' % pubid
+            if system is not None:
+                doctype += u' "%s"' % system
+        elif system is not None:
+            doctype += u' SYSTEM "%s"' % system
+        self.end_text()
+        self.state.characters(doctype)
+
+    def comment(self, text):
+        self.end_text()
+
+    def pi(self, target, data):
+        self.string(target + u' ' + data)
+
+    def data(self, data):
+        self.text(data)
+
+class BudgetTarget(LxmlTarget):
+    """ LxmlTarget for a ParseState with a Budget.  libxml2 can spin forever
+        when a target raises while it is closing tags, so StopParsing never
+        leaves here; the rest of the events are dropped instead and
+        state.truncated says why.
+    """
+    def guard(self, method, *args):
+        if not self.state.stopped:
+            try:
+                method(self, *args)
+            except StopParsing:
+                pass
+
+    def start(self, tag, attrs):
+        self.guard(LxmlTarget.start, tag, attrs)
+
+    def end(self, tag):
+        self.guard(LxmlTarget.end, tag)
+
+    def data(self, data):
+        self.guard(LxmlTarget.data, data)
+
+    def doctype(self, name, pubid, system):
+        self.guard(LxmlTarget.doctype, name, pubid, system)
+
+    def comment(self, text):
+        self.guard(LxmlTarget.comment, text)
+
+    def pi(self, target, data):
+        self.guard(LxmlTarget.pi, target, data)
+
+    def close(self):
+        self.guard(LxmlTarget.close)
+
+# parser backends, name -> function(html, state) that fires ParseState events
+parsers = {}
+# the backends that can take the page a piece at a time, name -> function(state)
+# that returns a parser with feed() and close()
+feeders = {}
+
+def stream(html, state):
+    parser = StreamParser(state)
+    parser.feed(html)
+    parser.close()
+parsers['stream'] = stream
+feeders['stream'] = StreamParser
+
+class LxmlFeeder(object):
+    """ lxml's HTMLParser for a page that is already unicode.  lxml hands it
+        to libxml2 as utf-8, which goes by the page's <meta charset> from the
+        second feed() on and decodes the rest of the page wrong, so the
+        <meta>s it sees say utf-8 too.  Bytes are left for libxml2 to sniff.
+    """
+    def __init__(self, state):
+        self.target = LxmlTarget(state) if state.budget is None else BudgetTarget(state)
+        self.parser = None
+
+    def feed(self, html):
+        if self.parser is None:
+            encoding = 'utf-8' if isinstance(html, unicode) else None
+            self.parser = load_etree().HTMLParser(target=self.target, strip_cdata=False, recover=True,
+                                                  encoding=encoding)
+        if isinstance(html, unicode):
+            html = meta_charset_re.sub(says_utf8, html).encode('utf-8')
+        self.parser.feed(html)
+
+    def close(self):
+        if self.parser is None:
+            self.feed(u'')
+        self.parser.close()
+
+    def stop(self, why):
+        """ drop the rest of the page, for a signal handler that can't raise
+            (see calling_libxml()).  Only a BudgetTarget listens.
+        """
+        state = self.target.state
+        if not state.stopped:
+            state.truncated = why
+            state.stopped = True
+
+def calling_libxml(frame):
+    """ the LxmlFeeder whose libxml2 called the code at frame (a signal
+        handler's), or None.  Raising in there can leave libxml2 spinning,
+        see BudgetTarget.
+    """
+    codes = LxmlFeeder.feed.__func__.__code__, LxmlFeeder.close.__func__.__code__
+    while frame is not None:
+        if frame.f_code in codes:
+            return frame.f_locals['self']
+        frame = frame.f_back
+    return None
+
+def says_utf8(match):
+    return match.group(0)[:match.start(1) - match.start(0)] + u'utf-8'
+
+if installed('lxml.etree'):
+    def lxml_target(html, state):
+        parser = LxmlFeeder(state)
+        parser.feed(html)
+        parser.close()
+    parsers['lxml'] = lxml_target
+    feeders['lxml'] = LxmlFeeder
+
+if bs_version == 4:
+    parsers['soup'] = lambda html, state: descend(timed('soup', soup, html), state)
+    parsers['bs4-html.parser'] = lambda html, state: descend(timed('soup', soup, html, 'html.parser'), state)
+    if 'lxml' in parsers:
+        parsers['bs4-lxml'] = lambda html, state: descend(timed('soup', soup, html, 'lxml'), state)
+elif bs_version == 3:
+    parsers['soup'] = parsers['bs3'] = lambda html, state: descend(timed('soup', soup, html), state)
+
+# fastest first.  'lxml' gives the same blocks as bs4 does with lxml installed,
+# 'stream' the same as bs4 does without it.
+default_parser = 'lxml' if 'lxml' in parsers else 'stream'
+
+# empty the scripts, styles, comments and the like before parsing, see
+# Stripper.  Turn it off to get the ignored blocks they made back in
+# page.parts.
+prestrip = True
+
+# start tags that every parser backend reads the same way
+tag_name = r'[a-zA-Z][^\s"\'<>/=\x00]*'
+tag_attrs = r'''(?:\s+[^\s"'<>/=\x00]+(?:\s*=\s*(?:"[^"]*"|'[^']*'|[^\s"'<>=`\x00]+))?)*\s*'''
+raw_text = ['script', 'style']
+# abbr and acronym are inline after all
+text_only = [name for name in ignorable
+             if actions[name] == 'ignore' and name not in raw_text and name not in void_tags]
+
+def anycase(name):
+    # the whole page searches, sre only skips ahead to a literal prefix
+    # without IGNORECASE
+    return ''.join('[%s%s]' % (c.lower(), c.upper()) for c in name)
+
+svg_tags = frozenset(['circle', 'clippath', 'defs', 'ellipse', 'g', 'line', 'lineargradient', 'mask', 'path',
+                      'pattern', 'polygon', 'polyline', 'radialgradient', 'rect', 'stop', 'symbol', 'use'])
+
+class Stripper(object):
+    """ html with the insides of the elements that would only make ignored
+        blocks taken out: script and style, comments, option, noscript and
+        the rest of ignorable when they only hold text, and inline SVG
+        that is only shapes.  Pages are often mostly script, this way none of
+        it gets tokenized or turned into blocks.
+
+        The tags stay, so the blocks either side come out the same.  Only
+        markup every parser backend reads the same way is touched, from the
+        first thing they might not (a quote left open, <script/>, an odd
+        comment) the page is left as it is.  So is a page with an empty
+        <title>, which takes its text from whatever block came before.  The
+        text-only elements are only emptied between <body> and </body>, the
+        parsers start the body at the first text they see outside it.
+    """
+    def __init__(self, raw_text=raw_text, text_only=text_only, svg_tags=svg_tags):
+        self.raw_text = raw_text
+        self.svg_tags = svg_tags
+        # text and tags up to the next thing to look at, or the next thing
+        # the parsers might not agree on
+        self.plain_re = re.compile(r'''(?:[^<]+
+                                       |<(?!(?:%s)[\s/>])%s%s/?>
+                                       |</%s\s*>
+                                       |<!doctype[^<>"']*(?:(?:"[^"<>]*"|'[^'<>]*')[^<>"']*)*>
+                                       |<\?[^<>]*>
+                                       |<(?![a-zA-Z/!?])
+                                       )*''' % ('|'.join(raw_text + text_only + ['svg']),
+                                                tag_name, tag_attrs, tag_name),
+                                   re.IGNORECASE | re.VERBOSE)
+        self.any_tag_re = re.compile(r'<(%s)%s/?>' % (tag_name, tag_attrs))
+        self.raw_text_re = re.compile(r'<(%s)%s>' % ('|'.join(raw_text), tag_attrs), re.IGNORECASE)
+        self.raw_end_res = dict((name, (re.compile(r'</\s*%s' % anycase(name)),
+                                        re.compile(r'</%s\s*>' % name, re.IGNORECASE)))
+                                for name in raw_text)
+        self.text_only_re = re.compile(r'(<(%s)%s>)[^<]*(</\2\s*>)' % ('|'.join(text_only), tag_attrs),
+                                       re.IGNORECASE)
+        self.comment_end_re = re.compile(r'--(?:\s+|!)>')
+        self.svg_re = re.compile(r'<svg%s>' % tag_attrs, re.IGNORECASE)
+        self.svg_end_re = re.compile(r'</\s*%s' % anycase('svg'))
+        self.svg_close_re = re.compile(r'</svg\s*>', re.IGNORECASE)
+        self.svg_content_re = re.compile(r'\s+|<(%s)%s(/?)>|</(%s)\s*>' % (tag_name, tag_attrs, tag_name))
+        self.title_re = re.compile(r'<%s%s(/?)>([^<]*)' % (anycase('title'), tag_attrs))
+        self.body_re = re.compile(r'<%s%s/?>' % (anycase('body'), tag_attrs))
+        self.body_end_re = re.compile(r'</\s*(?:%s|%s)' % (anycase('body'), anycase('html')))
+        self.entity_re = re.compile(r'&#?\w+;?')
+        self.letter_re = re.compile(r'\w', re.UNICODE)
+
+    def svg_is_empty(self, content):
+        """ nothing but shapes and whitespace, everything opened closed again """
+        opened = []
+        pos = 0
+        while pos < len(content):
+            m = self.svg_content_re.match(content, pos)
+            if m is None:
+                return False
+            start, closed, end = m.groups()
+            name = (start or end or '').lower()
+            if name and name not in self.svg_tags:
+                return False
+            if start and not closed:
+                opened.append(name)
+            elif end and (not opened or opened.pop() != name):
+                return False
+            pos = m.end()
+        return not opened
+
+    def __call__(self, html):
+        end = len(html)
+        for m in self.title_re.finditer(html):
+            if m.group(1) or not self.letter_re.search(self.entity_re.sub(u'', m.group(2))):
+                return html
+        m = self.body_re.search(html)
+        body = m.end() if m else end
+        m = self.body_end_re.search(html, body)
+        body_end = m.start() if m else end
+        out = []
+        pos = start = 0
+        while True:
+            pos = self.plain_re.match(html, pos).end()
+            if pos == end:
+                break
+            m = self.raw_text_re.match(html, pos)
+            if m:
+                # both parsers end it at the first </script when that is a
+                # plain </script>, not </scripts or </ script
+                first, plain = self.raw_end_res[m.group(1).lower()]
+                close = first.search(html, m.end())
+                if close is None or not plain.match(html, close.start()):
+                    break
+                out.append(html[start:m.end()])
+                start = pos = close.start()
+                continue
+            if html.startswith('<!--', pos):
+                close = html.find('-->', pos + 4)
+                if close < 0 or html.startswith(('>', '->'), pos + 4) or \
+                   self.comment_end_re.search(html, pos + 4, close):
+                    break
+                out.append(html[start:pos + 4])
+                start = close
+                pos = close + 3
+                continue
+            m = body <= pos < body_end and self.text_only_re.match(html, pos)
+            if m:
+                out.append(html[start:m.end(1)])
+                start = m.start(3)
+                pos = m.end()
+                continue
+            m = self.svg_re.match(html, pos)
+            if m:
+                close = self.svg_end_re.search(html, m.end())
+                if close is not None and self.svg_close_re.match(html, close.start()) and \
+                   self.svg_is_empty(html[m.end():close.start()]):
+                    out.append(html[start:m.end()])
+                    start = pos = close.start()
+                    continue
+            # one of them that can't be emptied, look inside
+            m = self.any_tag_re.match(html, pos)
+            if m is None or m.group(1).lower() in self.raw_text:
+                break
+            pos = m.end()
+        out.append(html[start:])
+        return u''.join(out)
+
+# compiling the Stripper takes longer than the rest of the import, so the
+# first page does it
+stripper = None
+
+def strip_ignored(html):
+    global stripper
+    if stripper is None:
+        stripper = Stripper()
+    return stripper(html)
+
+def parse_html(html, parser=None, budget=None):
+    """ parser is a key in parsers, defaults to the fastest one installed.
+        budget is a Budget to stop early on long pages.
+    """
+    state = ParseState(budget)
+    if budget is not None:
+        budget.start()
+        if budget.max_chars and len(html) > budget.max_chars:
+            html = html[:budget.max_chars]
+            state.truncated = 'max_chars'
+    html = timed('microsoft', cleaners.translate_microsoft, html)
+    html = timed('nurses', cleaners.translate_nurses, html)
+    if prestrip and not (budget is not None and budget.max_blocks):
+        # max_blocks counts the ignored blocks too
+        html = timed('strip', strip_ignored, html)
+    try:
+        timed('parse', parsers[parser or default_parser], html, state)
+    except StopParsing:
+        pass  # state.truncated says why
+    if budget is not None:
+        budget.truncated = state.truncated
     return state
 
-def merge_text_density(blocks):
-    for prev, curr in zip([Text()] + blocks, blocks):
-        if prev.wordcount and curr.wordcount and (prev.wordcount + curr.wordcount) > 30:
-            # roughly similar word densities
-            if 0.5 < (prev.word_density / curr.word_density) < 2.0:
+class Rule(object):
+    """ one step of a filter chain.  window says what func looks at:
+          'curr'   func(prev, curr, next, state), only curr is filled in
+          'prev'   prev and curr, prev is a blank Text() for the first block
+          'next'   prev, curr and next, blank Text()s off either end
+          'keep'   func(block), returning False drops the block from the chain
+          'stream' func(blocks) generator, yields each block back once it is
+                   done changing it.  For rules that hang on to blocks for an
+                   unknown stretch, like merge_blocks.
+          'list'   func(blocks) on the whole list, this ends a fused pass
+        state is a dict that lasts for one run over the blocks.
+
+        Calling a rule on a list runs just that rule, same as the plain
+        functions these used to be.
+    """
+    def __init__(self, func, window, **options):
+        self.func = func
+        self.window = window
+        self.options = options
+        self.__name__ = func.__name__
+        self.__doc__ = func.__doc__
+
+    def using(self, **options):
+        """ a copy of this rule with different options, eg minwords=50 """
+        return Rule(self.func, self.window, **dict(self.options, **options))
+
+    def stream(self, blocks):
+        func = self.func
+        if self.options:
+            func = functools.partial(func, **self.options)
+        if self.window == 'keep':
+            return (block for block in blocks if func(block))
+        elif self.window == 'stream':
+            return func(blocks)
+        elif self.window == 'list':
+            blocks = list(blocks)
+            func(blocks)
+            return iter(blocks)
+        return slide(func, blocks, self.window)
+
+    def __call__(self, blocks, **options):
+        return Pipeline(self.using(**options))(blocks)
+
+    def __repr__(self):
+        return '<%s %s window=%s %r>' % (self.__class__.__name__, self.__name__, self.window, self.options)
+
+def rule(window, **options):
+    """ decorator, turns a function into a Rule with the given window """
+    return lambda func: Rule(func, window, **options)
+
+def slide(func, blocks, window):
+    """ call func on each window over blocks and yield every block as soon as
+        it has left the window, so the next rule in the chain can have it.
+    """
+    state = {}
+    if window == 'curr':
+        for curr in blocks:
+            func(None, curr, None, state)
+            yield curr
+        return
+
+    prev = Text()  # before the first block, never yielded
+    first = True
+    if window == 'prev':
+        for curr in blocks:
+            func(prev, curr, None, state)
+            if not first:
+                yield prev
+            prev, first = curr, False
+        if not first:
+            yield prev
+        return
+
+    curr = None
+    for next in blocks:
+        if curr is not None:
+            func(prev, curr, next, state)
+            if not first:
+                yield prev
+            prev, first = curr, False
+        curr = next
+    if curr is not None:
+        func(prev, curr, Text(), state)
+        if not first:
+            yield prev
+        yield curr
+
+class Pipeline(object):
+    """ a chain of rules run over a list of blocks.  Everything between 'list'
+        rules is fused into one pass: each block goes through every rule in
+        turn and no intermediate lists get built.  Returns the blocks that
+        made it through the 'keep' rules.
+
+        Pipelines can be built out of other pipelines, eg
+        Pipeline(article_rules, only_content)
+
+        name=, if given, prefixes the rule names in traces.
+    """
+    def __init__(self, *rules, **options):
+        self.name = options.get('name')
+        self.rules = []
+        for rule in rules:
+            if isinstance(rule, Pipeline):
+                self.rules.extend(rule.rules)
+            else:
+                self.rules.append(rule)
+
+    def __call__(self, blocks):
+        tracer = traced.tracer
+        if tracer is not None:
+            return tracer.pipeline(self, blocks)
+        stream = iter(blocks)
+        for rule in self.rules:
+            stream = rule.stream(stream)
+        return list(stream)
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.rules)
+
+@rule('keep')
+def not_ignored(block):
+    return not block.ignore
+
+@rule('keep')
+def only_content(block):
+    return block.is_content
+
+@rule('prev')
+def merge_text_density(prev, curr, next, state):
+    if prev.wordcount and curr.wordcount and (prev.wordcount + curr.wordcount) > 30:
+        # roughly similar word densities
+        if 0.5 < (prev.word_density / curr.word_density) < 2.0:
+            if debug:
                 log("\tMerging! %r" %[(curr.is_content, prev.is_content, prev.word_density, curr.word_density)])
-                curr.merge(prev)
-                prev.labels.add('ignore')
-                prev.labels.add('ignore_merge_text_density')
+            curr.merge(prev)
+            prev.mark(label.ignore, 'ignore_merge_text_density')
     return
 
-def density_marker(blocks):
-    for prev, curr, next in zip([Text()] + blocks, blocks, blocks[1:] + [Text()]):
+@rule('next')
+def density_marker(prev, curr, next, state):
+    if debug:
         log("\nCM %r\n" % [((curr.link_density, curr.wordcount), (prev.link_density, prev.wordcount), (next.link_density, next.wordcount), curr.text)])
-        if curr.link_density <= 0.333333:
-            if prev.link_density <= 0.555556:
-                if curr.word_density <= 9:
-                    if next.word_density <= 10:
-                        if prev.word_density <= 4:
-                            use = False
-                        else:
-                            use = True
+    # when the tree doesn't decide the last block's answer sticks
+    if curr.link_density <= 0.333333:
+        if prev.link_density <= 0.555556:
+            if curr.word_density <= 9:
+                if next.word_density <= 10:
+                    if prev.word_density <= 4:
+                        state['use'] = False
                     else:
-                        use = True
+                        state['use'] = True
                 else:
-                    if next.word_density:
-                        use = True
-                    else:
-                        use = False
-        else:
-            use = False
-        if use:
-            #print "\tIMMA", (use, '%4.2f' % curr.word_density, curr)
-            curr.labels.add('content')
-            curr.labels.add('content_density_marker')
-
-def li_tags_are_content(blocks):
-    tagcount = 999
-    for block in blocks:
-        if block.is_content and 'likely_content' in block.labels:
-            tagcount = len(block.tags)
-        elif len(block.tags) > tagcount and 'maybe_content' in block.labels and \
-           'li' in block.labels and block.link_density == 0:
-            if not block.is_content:
-                block.labels.discard('ignore')
-                block.labels.add('!ignore_li_tags_are_content')
-                block.labels.add('content')
-            block.labels.add('content_li_tags_are_content')
-        else:
-            tagcount = 999
+                    state['use'] = True
+            else:
+                if next.word_density:
+                    state['use'] = True
+                else:
+                    state['use'] = False
+    else:
+        state['use'] = False
+    if state['use']:
+        #print "\tIMMA", (use, '%4.2f' % curr.word_density, curr)
+        curr.mark(label.content, 'content_density_marker')
+
+@rule('curr')
+def li_tags_are_content(prev, block, next, state):
+    tagcount = state.get('tagcount', 999)
+    if block.is_content and block.flags & label.likely_content:
+        state['tagcount'] = len(block.tags)
+    elif len(block.tags) > tagcount and block.flags & label.maybe_content and \
+       block.flags & label.li and block.link_density == 0:
+        if not block.is_content:
+            block.unmark(label.ignore, '!ignore_li_tags_are_content')
+            block.mark(label.content)
+        block.note('content_li_tags_are_content')
+    else:
+        state['tagcount'] = 999
 
+@rule('list')
 def content_by_taglevel(blocks, minwords=100):
     for block in blocks:
-        if 'likely_content' in block.labels:
+        if block.flags & label.likely_content:
             main = block
             break
     else:
@@ -291,38 +1262,37 @@ def content_by_taglevel(blocks, minwords=100):
     for block in blocks:
         if not block.is_content and len(block.tags) == len(main.tags) and block.wordcount >= minwords:
             if not block.is_content:
-                block.labels.discard('ignore')
-                block.labels.add('!ignore_content_by_taglevel')
-                block.labels.add('content')
-            block.labels.add('content_content_by_taglevel')
-
-def title_starts_content(blocks):
-    it = iter(blocks)
-    for block in it:
-        if 'title' in block.labels and block.is_content:
-            break
-    for block in it:
-        if 'maybe_conent' in block.labels or 'likely_content' in block.labels:
-            if not block.is_content:
-                block.labels.discard('ignore')
-                block.labels.add('!ignore_title_start_content')
-                block.labels.add('content')
-            block.labels.add('content_title_start_content')
+                block.unmark(label.ignore, '!ignore_content_by_taglevel')
+                block.mark(label.content)
+            block.note('content_content_by_taglevel')
+
+@rule('curr')
+def title_starts_content(prev, block, next, state):
+    if not state.get('seen_title'):
+        if block.flags & label.title and block.is_content:
+            state['seen_title'] = True
+        return
+    # this used to check 'maybe_conent' too, a typo that never matched
+    if block.flags & label.likely_content:
+        if not block.is_content:
+            block.unmark(label.ignore, '!ignore_title_start_content')
+            block.mark(label.content)
+        block.note('content_title_start_content')
 
+@rule('list')
 def largest_block(blocks, expand_same_level=True, minwords=150):
     best = (0, -1)
     for i, block in enumerate(blocks):
-        if block.is_content or 'maybe_content' in block.labels:
+        if block.is_content or block.flags & label.maybe_content:
             if block.wordcount > minwords:
                 best = max(best, (block.wordcount, i))
     longest, i = best
     if not longest:
         return
     main = blocks[i]
-    main.labels.add('likely_content')
+    main.mark(label.likely_content)
     for block in blocks:
-        block.labels.add('maybe_content')
-        block.labels.add('maybe_content_largest_block')
+        block.mark(label.maybe_content, 'maybe_content_largest_block')
 
     # run to the left and right of best marking adjacent tags as content
     for adjacents in [reversed(blocks[:i]), blocks[i+1:]]:
@@ -331,110 +1301,106 @@ def largest_block(blocks, expand_same_level=True, minwords=150):
                 break
             elif len(adj.tags) == len(main.tags):
                 if not block.is_content:
-                    adj.labels.discard('ignore')
-                    adj.labels.add('!ignore_largest_block')
-                    adj.labels.add('content')
-                adj.labels.add('content_largest_block')
+                    adj.unmark(label.ignore, '!ignore_largest_block')
+                    adj.mark(label.content)
+                adj.note('content_largest_block')
 
+@rule('stream')
 def merge_blocks(blocks, content_only=False, same_depth_only=False):
     # we dropped the 'block distance' metric - they just use adjacents
-    it = iter(blocks)
-    try:
-        prev = Text()
-        curr = next(it)
+    prev = Text()
+    held = []  # prev and everything merged into it, not done until prev is
+    if debug:
         log('\n\t--START MERGE--\n')
-        while True:
+    for curr in blocks:
+        if debug:
             log(prev)
             log(curr)
-            if not curr.is_content or \
-               (content_only and (not curr.is_content or not prev.is_content)) or \
-               (same_depth_only and len(curr.tags) != len(prev.tags)):
+        if not curr.is_content or \
+           (content_only and (not curr.is_content or not prev.is_content)) or \
+           (same_depth_only and len(curr.tags) != len(prev.tags)):
+            if debug:
                 log("NOTerging %r" %[(curr.is_content, prev.is_content, len(curr.tags), len(prev.tags))])
-                prev = curr
-                curr = next(it)
-                continue
-            else:
+            for block in held:
+                yield block
+            held = [curr]
+            prev = curr
+        else:
+            if debug:
                 log("\tMerging! %r" %[(curr.is_content, prev.is_content, len(curr.tags), len(prev.tags))])
-                # the original doesn't care if prev is not content
-                prev.merge(curr)
-                curr.labels.add('ignore')
-                curr.labels.add('ignore_merge_blocks')
-                curr = next(it)
-                # prev is NOT advanced
-    except StopIteration:  # haters gonna hate
-        pass
-
-def ignore_trailing_headlines(blocks):
-    for prev, curr in zip([Text()] + blocks, blocks):
-        if prev.is_content:
-            if 'heading' in curr.labels:
-                curr.labels.add('ignore')
-                curr.labels.add('ignore_trailing_headlines')
-            else:
-                break
-    return
+            # the original doesn't care if prev is not content
+            prev.merge(curr)
+            curr.mark(label.ignore, 'ignore_merge_blocks')
+            held.append(curr)
+            # prev is NOT advanced
+    for block in held:
+        yield block
 
-def ignore_after_content(blocks, minwords=60):
-    wordcount = 0
-    it = iter(blocks)
-    for block in it:
-        if block.is_content:
-            wordcount += block.wordcount
-        if 'end_of_text' in block.labels and wordcount > minwords:
-            break
-    for block in it:
-        block.labels.add('ignore')
-        block.labels.add('ignore_after_content')
-    return
+@rule('prev')
+def ignore_trailing_headlines(prev, curr, next, state):
+    if state.get('done'):
+        return
+    if prev.is_content:
+        if curr.flags & label.heading:
+            curr.mark(label.ignore, 'ignore_trailing_headlines')
+        else:
+            state['done'] = True
+
+@rule('curr')
+def ignore_after_content(prev, block, next, state, minwords=60):
+    if state.get('done'):
+        block.mark(label.ignore, 'ignore_after_content')
+        return
+    if block.is_content:
+        state['wordcount'] = state.get('wordcount', 0) + block.wordcount
+    if block.flags & label.end_of_text and state.get('wordcount', 0) > minwords:
+        state['done'] = True
 
-def ignore_comments(blocks):
+@rule('curr')
+def ignore_comments(prev, block, next, state):
     """ lone text pieces seen in the wild
           u'Sign in'
           u'Forgot your password?'
           u'Create AccountSign In'  #youtube
     """
-    for block in blocks:
-        if block.text.lower().startswith((u'sign in', u'Forgot your password?',
-                                          u'Create AccountSign In', u'You are using an outdated browser')):
-            block.labels.add('ignore')
-            block.labels.add('ignore_ignore_comments')
-    return
+    if block.text.lower().startswith((u'sign in', u'Forgot your password?',
+                                      u'Create AccountSign In', u'You are using an outdated browser')):
+        block.mark(label.ignore, 'ignore_ignore_comments')
 
-def content_marker(blocks):
-    for prev, curr, next in zip([Text()] + blocks, blocks, blocks[1:] + [Text()]):
+@rule('next')
+def content_marker(prev, curr, next, state):
+    if debug:
         log("\nCM %r\n" % [((curr.link_density, curr.wordcount), (prev.link_density, prev.wordcount), (next.link_density, next.wordcount), curr.text)])
-        if curr.link_density > 0.333333:
-            continue
-        if prev.link_density <= 0.555556:
-            if curr.wordcount > 16 and next.wordcount > 15 and prev.wordcount > 4:
-                curr.labels.add('content_content_marker1')
-                curr.labels.add('content')
-            elif prev.is_content and curr.wordcount > 20 and next.wordcount > 7:
-                curr.labels.add('maybe_content')
-                curr.labels.add('maybe_content_content_marker')
-        elif curr.wordcount > 40 and next.wordcount > 17:
-            curr.labels.add('content')
-            curr.labels.add('content_content_marker2')
-        elif curr.wordcount > 100 and 'maybe_content' in curr.labels:
-            curr.labels.add('content')
-            curr.labels.add('content_content_marker3')
-    return
+    if curr.link_density > 0.333333:
+        return
+    if prev.link_density <= 0.555556:
+        if curr.wordcount > 16 and next.wordcount > 15 and prev.wordcount > 4:
+            curr.mark(label.content, 'content_content_marker1')
+        elif prev.is_content and curr.wordcount > 20 and next.wordcount > 7:
+            curr.mark(label.maybe_content, 'maybe_content_content_marker')
+    elif curr.wordcount > 40 and next.wordcount > 17:
+        curr.mark(label.content, 'content_content_marker2')
+    elif curr.wordcount > 100 and curr.flags & label.maybe_content:
+        curr.mark(label.content, 'content_content_marker3')
 
-def terminating_blocks(blocks):
-    copyright = chr(169)
-    for block in blocks:
+end_of_text_re = re.compile(r'\d+\s+(comments|users responded in)', re.IGNORECASE)
+end_of_text_starts = (u'comments', u'\xa9 reuters', u'please rate this',
+                      u'post a comment', u'what you think', u'add your comment',
+                      u'add comment', u'reader views', u'have your say',
+                      u'reader comments', u'r\xe4tta artikeln',
+                      u'thanks for your comments - this feedback is now closed')
+
+def is_end_of_text(block):
+    """ the start of the comments, or the small print after the article """
+    if block.wordcount < 15 and block.length >= 8:
         text = block.text
-        if block.wordcount < 15 and len(text) >= 8:
-            if re.match('\d+\s+(comments|users responded in', text, re.IGNORE_CASE) or \
-               text.lower().startswith(('comments', copyright + ' reuters', 'please rate this',
-                                        'post a comment', 'what you think', 'add your comment',
-                                        'add comment', 'reader views', 'have your say',
-                                        'reader comments', 'r\xe4tta artikeln',
-                                        'thanks for your comments - this feedback is now closed')):
-               block.labels.add('end_of_text')
-        elif (0.99 < block.link_density < 1.01 and text.lower().startswith('comment')):
-            block.labels.add('end_of_text')
-    return
+        return bool(end_of_text_re.match(text)) or text.lower().startswith(end_of_text_starts)
+    return 0.99 < block.link_density < 1.01 and block.text.lower().startswith(u'comment')
+
+@rule('curr')
+def terminating_blocks(prev, block, next, state):
+    if is_end_of_text(block):
+        block.mark(label.end_of_text, 'end_of_text_terminating_blocks')
 
 def title_cleaner(title):
     splitter = "\s*[\xbb|,:()\-\xa0]+\s*"
@@ -442,38 +1408,46 @@ def title_cleaner(title):
     best = best.replace("'", "", 1)
     return best
 
-def simple_filter(html):
-    page = parse_html(html)
-    blocks = page.parts
-    blocks = [block for block in blocks if not block.ignore]
-    merge_text_density(blocks)
-    merge_blocks(blocks)
-    density_marker(blocks)
-    page.good = [block for block in blocks if block.is_content]
-    largest_block(blocks)
-    page.good = [block for block in blocks if block.is_content]
+simple_rules = Pipeline(not_ignored, merge_text_density, merge_blocks, density_marker,
+                        largest_block, name='simple')
+
+# terminating_blocks isn't in here, Budget(stop_at_end=True) marks the
+# end-of-text blocks for ignore_after_content as they are parsed
+article_rules = Pipeline(not_ignored, content_marker, ignore_after_content,
+                         ignore_trailing_headlines, merge_blocks, only_content,
+                         merge_blocks.using(content_only=True, same_depth_only=True),
+                         largest_block, title_starts_content, content_by_taglevel,
+                         li_tags_are_content, name='article')
+
+def parse_page(html, parser=None, site=None, budget=None):
+    """ parse_html(), then site picks the blocks worth classifying into
+        page.blocks.  The page can go through any number of filter_page()s.
+    """
+    page = parse_html(html, parser, budget)
+    page.blocks = site(page.parts) if site else page.parts
     return page
 
-def article_filter(html):
-    page = parse_html(html)
-    blocks = page.parts
-    log(len(blocks))
-    blocks = [block for block in blocks if not block.ignore]
-    log(len(blocks))
-    content_marker(blocks)
-    ignore_after_content(blocks)
-    ignore_trailing_headlines(blocks)
-    merge_blocks(blocks)
-    blocks = [block for block in blocks if block.is_content]
-    log(len(blocks))
-    merge_blocks(blocks, content_only=True, same_depth_only=True)
-    largest_block(blocks)
-    title_starts_content(blocks)
-    content_by_taglevel(blocks)
-    li_tags_are_content(blocks)
+def filter_page(page, rules, copy=True):
+    """ run rules over page.blocks and put the content ones in page.good.
+        With copy the rules get a copy of the page and the one passed in is
+        left as it was, ready for the next filter.
+    """
+    if copy:
+        page = page.copy()
+    blocks = rules(page.blocks)
     page.good = [block for block in blocks if block.is_content]
     return page
 
+def simple_filter(html, parser=None, site=None, budget=None):
+    return filter_page(parse_page(html, parser, site, budget), simple_rules, copy=False)
+
+def article_filter(html, parser=None, site=None, budget=None):
+    """ site takes the parsed blocks and returns the ones worth classifying,
+        eg TemplateIndex.site(host) drops the chrome it has seen before.
+        budget is a Budget, page.truncated says if it cut the page short.
+    """
+    return filter_page(parse_page(html, parser, site, budget), article_rules, copy=False)
+
 def clean_body(body, title):
     body = body.strip()
     if body and title:
@@ -487,64 +1461,352 @@ def clean_body(body, title):
 
     return body
 
-def meat(html):
-    page = article_filter(html)
+def article_text(page):
+    """ title and body of a page that has been through article_rules """
     blocks = sorted(page.good, key=lambda x:x.wordcount, reverse=True)
     title = page.title
+    page.best = None
     for p in blocks:
-        if 'likely_content' in p.labels:
+        if p.flags & label.likely_content:
             best = p.text
             break
     else:
         for p in page.good:
-            if 'maybe_content' in p.labels:
+            if p.flags & label.maybe_content:
                 best = p.text
                 break
         else:
             return title, u''
-    best = clean_body(best, title)
+    page.best = p  # the block the body came out of
+    best = timed('clean_body', clean_body, best, title)
     return title, best
 
-def meat2(html):
-    page = simple_filter(html)
+def simple_text(page):
+    """ title and body of a page that has been through simple_rules """
     title = page.title
     blocks = sorted(page.good, key=lambda x:x.wordcount)
+    page.best = blocks[-1] if blocks else None
     if not blocks:
         return title, u''
     best = blocks[-1].text
-    best = clean_body(best, title)
+    best = timed('clean_body', clean_body, best, title)
     return title, best
 
-def decode_data(data, headers={}):
+def largest_paragraph(page):
+    """ title and the longest paragraph of a page from parse_page(), for when
+        there's no time left to run the filters
+    """
+    page.best = None
+    blocks = [block for block in page.blocks if not block.ignore]
+    blocks = [block for block in blocks if block.flags & label.maybe_content] or blocks
+    if not blocks:
+        return page.title, u''
+    page.best = max(blocks, key=lambda x:x.wordcount)
+    page.best.mark(label.content, 'content_largest_paragraph')
+    page.good = [page.best]
+    return page.title, timed('clean_body', clean_body, page.best.text, page.title)
+
+def meat(html, parser=None, site=None, budget=None):
+    return article_text(article_filter(html, parser, site, budget))
+
+def meat2(html, parser=None, site=None, budget=None):
+    return simple_text(simple_filter(html, parser, site, budget))
+
+# what extract_text() tries in order, (rules, function from the filtered page
+# to (title, body))
+strategies = [(article_rules, article_text), (simple_rules, simple_text)]
+
+def best_filter(page, strategies=strategies):
+    """ (filtered page, title, body) from the first of the strategies that
+        finds a title and body in a page from parse_page().  When none of
+        them do it is the first one's page and blanks.  Every strategy works
+        on its own copy of the blocks.
+
+        If the page's Budget runs out of time, before or between strategies,
+        the rest are skipped for largest_paragraph() and page.degraded is set.
+    """
+    budget = page.budget
+    first = None
+    for rules, text in strategies:
+        if budget is not None and (page.truncated == 'max_seconds' or budget.over()):
+            filtered = page.copy()
+            filtered.degraded = budget.degraded = True
+            title, body = timed('largest_paragraph', largest_paragraph, filtered)
+            if title and body:
+                return filtered, title, body
+            return filtered, '', ''
+        filtered = filter_page(page, rules)
+        title, body = text(filtered)
+        if title and body:
+            return filtered, title, body
+        first = first or filtered
+    return first, '', ''
+
+def extract_page(page, strategies=strategies):
+    """ the first title and body one of the strategies finds in a page from
+        parse_page()
+    """
+    filtered, title, body = best_filter(page, strategies)
+    return title, body
+
+# byte order marks, the codecs named here skip them
+boms = [('\xef\xbb\xbf', 'utf-8-sig'), ('\xff\xfe', 'utf-16'), ('\xfe\xff', 'utf-16')]
+charset_re = re.compile(r'''charset\s*=\s*["\']?\s*([\w:.-]+)''', re.IGNORECASE)
+# <meta charset="x"> and <meta http-equiv="Content-Type" content="text/html; charset=x">
+meta_charset_re = re.compile(r'''<meta[^>]+?charset\s*=\s*["\']?\s*([\w:.-]+)''', re.IGNORECASE)
+sniff_bytes = 4096
+# what pages that don't know any better say, valid utf-8 is the better bet
+western = frozenset(['ascii', 'iso8859-1', 'iso8859-15', 'cp1252'])
+
+def gunzip(data):
+    """ every gzip member in data, decompressed """
+    if not isinstance(data, (str, buffer)):
+        data = memoryview(data).tobytes()
+    out = []
+    while data[:2] == '\x1f\x8b':
+        unzip = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        out.append(unzip.decompress(data))
+        data = unzip.unused_data
+    return ''.join(out)
+
+def codec_name(name):
     try:
-        import magic, gzip, StringIO
-        if magic.from_buffer(data).startswith('gzip'):
-            data = gzip.GzipFile(fileobj=StringIO.StringIO(data)).read()
+        return codecs.lookup(name).name
+    except LookupError:
+        return None
+
+def sniff_encoding(data, headers={}):
+    """ the codec the page says it is in, from the BOM, the Content-Type
+        header or a <meta> in the first few KB.  None if it doesn't say.
+    """
+    head = data[:sniff_bytes]
+    if not isinstance(head, str):
+        head = memoryview(head).tobytes()
+    for bom, codec in boms:
+        if head.startswith(bom):
+            return codec
+    match = charset_re.search(headers.get('content-type', ''))
+    if match:
+        codec = codec_name(match.group(1))
+        if codec:
+            return codec
+    match = meta_charset_re.search(head)
+    if match:
+        codec = codec_name(match.group(1))
+        if codec and codec.startswith(('utf-16', 'utf-32')):
+            return 'utf-8'  # we just read the <meta> as ascii, so it isn't
+        return codec
+    return None
+
+def decode_data(data, headers={}):
+    """ the page as unicode.  data can be a str, buffer, bytearray or
+        memoryview, it is decoded in place.  Gzipped pages get unpacked.
+        A page that names a codec is decoded with it; one that doesn't, or
+        names a western one but is valid utf-8 anyway, is utf-8 and the rest
+        are windows-1252.
+    """
+    if isinstance(data, unicode):
+        return data
+    if data[:2] == '\x1f\x8b':
+        try:
+            data = gunzip(data)
+        except zlib.error:
+            pass
+        else:
             if 'content-encoding' in headers:
                 headers['content-encoding'] = headers['content-encoding'].replace('gzip', '')
-    except ImportError:
-        pass
-    for encoding in ['utf-8', 'latin1']:
+    codec = sniff_encoding(data, headers)
+    tries = ['utf-8', 'cp1252']
+    if codec and codec not in western and codec not in tries:
+        tries.insert(0, codec)
+    for codec in tries:
         try:
-            return data.decode(encoding)
+            return codecs.getdecoder(codec)(data)[0]
         except UnicodeError:
             pass
-    # the feedparser version is veeery slow, try it last.
-    try:
-        import feedparser
-        return feedparser.convert_to_utf8(headers, data)
-    except ImportError:
-        pass
-    return data.decode(encoding, 'ignore')
-
-def extract_text(html):
-    """ take the HTML and attempt to return plain text (minus headers/footers/navigation/etc) """
-    html = decode_data(html)
-    for func in [meat, meat2]:
-        title, body = func(html)
-        if title and body:
-            return title, body
-    return '', ''
+    return codecs.latin_1_decode(data)[0]
+
+def extract_text(html, parser=None, headers=None, site=None, budget=None):
+    """ take the HTML and attempt to return plain text (minus headers/footers/navigation/etc)
+        headers are the HTTP response headers (lowercase names) if you have them.
+        site is a per-site template, see templates.TemplateIndex.site()
+        budget is a Budget, afterwards budget.truncated says if the page was cut
+    """
+    if traced.tracer is not None:
+        traced.tracer.begin()
+    html = timed('decode', decode_data, html, headers or {})
+    return extract_page(parse_page(html, parser, site, budget))
+
+class Extractor(object):
+    """ extract_text() for a page that arrives a piece at a time.  Every
+        feed() is unzipped, decoded and parsed as it comes in, so the fetch
+        and the parse overlap and only the unparsed tail is held on to.
+
+        extractor = Extractor(headers=response_headers, budget=Budget())
+        for chunk in response:
+            extractor.feed(chunk)
+            if extractor.done:
+                break  # the article is over, the rest is comments
+        title, body = extractor.close()
+
+        finish() instead of close() returns the parsed page, for
+        structured.page_blocks() or anything else that takes a page from
+        parse_page().
+
+        title is there as soon as </title> has gone by.  done is set once the
+        budget has stopped the parse, nothing fed after that is looked at.
+
+        Unless the Content-Type header or a BOM names the codec nothing is
+        parsed until there are sniff_bytes to look for a <meta> in.  When a
+        page turns out not to be in that codec part way through, decode_data()
+        would decode all of it again with the next codec down; the start is
+        gone by then, so only the rest of the page gets it.  The BeautifulSoup
+        backends can't take a page in pieces and parse all of it at close().
+    """
+    def __init__(self, parser=None, headers=None, site=None, budget=None):
+        self.parser = parser or default_parser
+        self.headers = headers or {}
+        self.site = site
+        self.budget = budget
+        self.state = ParseState(budget)
+        if budget is not None:
+            budget.start()
+        self.feeder = feeders[self.parser](self.state) if self.parser in feeders else None
+        self.pending = []  # the page so far, for the backends that aren't feeders
+        self.tail = u''  # from the last < on, held back until the next piece
+        self.head = ''  # bytes until there are enough to sniff the codec
+        self.gzipped = None  # until there are two bytes to look at
+        self.unzip = None
+        self.decoder = None
+        self.codecs = None
+        self.chars = 0
+        self.cr = False
+        self.done = False
+        if traced.tracer is not None:
+            traced.tracer.begin()
+
+    @property
+    def title(self):
+        return self.state.title
+
+    def feed(self, data):
+        """ the next piece of the page, bytes (maybe gzipped) or unicode """
+        if self.done:
+            return
+        if not isinstance(data, unicode):
+            data = timed('decode', self.decode, data, False)
+        self.parse(data)
+
+    def decode(self, data, final):
+        if self.gzipped is None:
+            data = self.head + data
+            if len(data) < 2 and not final:
+                self.head = data
+                return u''
+            self.head = ''
+            self.gzipped = data[:2] == '\x1f\x8b'
+            if self.gzipped:
+                self.unzip = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if self.gzipped:
+            data = self.gunzip(data)
+        if self.decoder is None:
+            self.head += data
+            if len(self.head) < sniff_bytes and not final and not self.declared():
+                return u''
+            data, self.head = self.head, ''
+            codec = sniff_encoding(data, self.headers)
+            # the same tries as decode_data()
+            self.codecs = ['utf-8', 'cp1252', 'latin-1']
+            if codec and codec not in western and codec not in self.codecs:
+                self.codecs.insert(0, codec)
+            self.decoder = codecs.getincrementaldecoder(self.codecs[0])()
+        return self.decode_as(data, final)
+
+    def declared(self):
+        """ whether sniff_encoding() can go by the header or a BOM, and
+            doesn't need to see any <meta>s
+        """
+        match = charset_re.search(self.headers.get('content-type', ''))
+        return bool(match and codec_name(match.group(1))) or \
+            self.head.startswith(tuple(bom for bom, codec in boms))
+
+    def decode_as(self, data, final):
+        try:
+            return self.decoder.decode(data, final)
+        except UnicodeDecodeError, e:
+            self.codecs.pop(0)
+            self.decoder = codecs.getincrementaldecoder(self.codecs[0])()
+            return e.object[:e.start].decode(e.encoding) + self.decode_as(e.object[e.start:], final)
+
+    def gunzip(self, data):
+        out = []
+        while data and self.unzip is not None:
+            try:
+                out.append(self.unzip.decompress(data))
+            except zlib.error:
+                self.unzip = None  # gunzip() drops trailing junk too
+                break
+            data = self.unzip.unused_data
+            if data:
+                # the next gzip member
+                self.unzip = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        return ''.join(out)
+
+    def parse(self, text, final=False):
+        if self.cr:
+            text = u'\r' + text
+        # a \r\n could be split across two pieces, translate_nurses() needs both halves
+        self.cr = text.endswith(u'\r') and not final
+        if self.cr:
+            text = text[:-1]
+        budget = self.budget
+        if budget is not None and budget.max_chars and self.chars + len(text) > budget.max_chars:
+            text = text[:budget.max_chars - self.chars]
+            self.state.truncated = 'max_chars'
+            self.done = True
+        self.chars += len(text)
+        text = timed('microsoft', cleaners.translate_microsoft, text)
+        text = timed('nurses', cleaners.translate_nurses, text)
+        if self.feeder is None:
+            self.pending.append(text)
+            return
+        # libxml2 doesn't always read a tag split across two feed()s the way
+        # it reads it whole, so every piece stops just before a <
+        text = self.tail + text
+        cut = len(text) if final or self.done else text.rfind(u'<')
+        if cut < 0:
+            self.tail = text
+            return
+        text, self.tail = text[:cut], text[cut:]
+        try:
+            timed('parse', self.feeder.feed, text)
+        except StopParsing:
+            pass
+        # the lxml backend doesn't raise, see BudgetTarget
+        self.done = self.done or self.state.stopped
+
+    def close(self):
+        """ the end of the page, returns (title, body) like extract_text() """
+        return extract_page(self.finish())
+
+    def finish(self):
+        """ the end of the page, returns it parsed like parse_page() """
+        if not self.done:
+            text = timed('decode', self.decode, '', True) if self.decoder is not None or self.head else u''
+            self.parse(text, final=True)
+        state = self.state
+        try:
+            if self.feeder is None:
+                timed('parse', parsers[self.parser], u''.join(self.pending), state)
+            elif not state.stopped:
+                timed('parse', self.feeder.close)
+        except StopParsing:
+            pass
+        self.done = True
+        if self.budget is not None:
+            self.budget.truncated = state.truncated
+        state.blocks = self.site(state.parts) if self.site else state.parts
+        return state
 
 x = u'''
 make a rule to mark these down.
@@ -0,0 +1,213 @@
+"""
+ Copyright Curata, Inc c/o Jack Diederich
+
+ The author licenses this file to You under the Apache License, Version 2.0
+ (the "License"); you may not use this file except in compliance with
+ the License.  You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ Extraction results cached by a hash of the raw page, so refetching a page
+ that hasn't changed doesn't cost another extraction.
+"""
+import collections
+import hashlib
+import json
+import os
+import time
+
+from . import boilerpot
+
+def cache_key(data, func, parser=None, headers=None):
+    """ hash of the raw bytes plus everything else that changes the answer.
+        Of the headers only the ones decoding goes by count, the likes of
+        Date, ETag and Set-Cookie are different on every fetch of a page.
+    """
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+    headers = headers or {}
+    match = boilerpot.charset_re.search(headers.get('content-type', ''))
+    charset = match and boilerpot.codec_name(match.group(1))
+    digest = hashlib.sha1(data)
+    digest.update(repr((boilerpot.__version__, func, parser, charset, headers.get('content-encoding'))))
+    return digest.hexdigest()
+
+class LRUCache(object):
+    """ in-memory, holds the most recently used maxsize results """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.data = collections.OrderedDict()
+
+    def get(self, key):
+        try:
+            value = self.data.pop(key)
+        except KeyError:
+            return None
+        self.data[key] = value
+        return value
+
+    def put(self, key, value):
+        self.data.pop(key, None)
+        self.data[key] = value
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def __len__(self):
+        return len(self.data)
+
+class SqliteStore(object):
+    """ a sqlite file any number of processes can share.  Subclasses set
+        self.path and make their tables in setup(db).
+    """
+    _db = None
+    _pid = None
+
+    @property
+    def db(self):
+        # connections can't cross a fork, each process opens its own
+        if self._db is None or self._pid != os.getpid():
+            import sqlite3
+            db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self.setup(db)
+            self._db = db
+            self._pid = os.getpid()
+        return self._db
+
+    def setup(self, db):
+        pass
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_db', None)
+        state.pop('_pid', None)
+        return state
+
+class DiskCache(SqliteStore):
+    """ sqlite backed, so any number of processes can share one file.
+
+        Entries older than max_age seconds are dropped, and once the results
+        add up to more than max_bytes the least recently used go first.
+        Eviction runs every evict_every puts, not on every one.
+    """
+    def __init__(self, path, max_bytes=1 << 30, max_age=30 * 86400, evict_every=100):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evict_every = evict_every
+        self.puts = 0
+
+    def setup(self, db):
+        db.execute('CREATE TABLE IF NOT EXISTS results'
+                   ' (key TEXT PRIMARY KEY, value BLOB, size INTEGER, created REAL, used REAL)')
+        db.execute('CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+
+    def get(self, key):
+        row = self.db.execute('SELECT value, created FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        value, created = row
+        now = time.time()
+        if self.max_age and created < now - self.max_age:
+            return None
+        self.db.execute('UPDATE results SET used = ? WHERE key = ?', (now, key))
+        return json.loads(str(value))
+
+    def put(self, key, value):
+        value = json.dumps(value)
+        now = time.time()
+        self.db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                        (key, buffer(value), len(value), now, now))
+        self.puts += 1
+        if self.puts % self.evict_every == 0:
+            self.evict()
+
+    def evict(self):
+        db = self.db
+        if self.max_age:
+            db.execute('DELETE FROM results WHERE created < ?', (time.time() - self.max_age,))
+        if self.max_bytes:
+            total = db.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+            for key, size in db.execute('SELECT key, size FROM results ORDER BY used').fetchall():
+                if total <= self.max_bytes:
+                    break
+                db.execute('DELETE FROM results WHERE key = ?', (key,))
+                total -= size
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+class ExtractionCache(object):
+    """ extract_text/meat/meat2 with a memory LRU in front of an optional
+        on-disk cache.  hits and misses count lookups.
+
+        Pass it to extract_many(cache=...) to share the disk cache between the
+        worker processes, each worker gets its own LRU.  The workers' hits
+        and misses are added to it as the results come back, the memory
+        count in stats is only this process's LRU.
+    """
+    def __init__(self, maxsize=1024, path=None, **disk_options):
+        self.maxsize = maxsize
+        self.memory = LRUCache(maxsize)
+        self.disk = DiskCache(path, **disk_options) if path else None
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                value = tuple(value)
+                self.memory.put(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def store(self, key, value):
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    def call(self, func, html, parser=None, headers=None, budget=None):
+        """ a page the budget cut short isn't stored """
+        key = cache_key(html, func.__name__, parser, headers)
+        value = self.lookup(key)
+        if value is None:
+            args = (html, parser) if headers is None else (html, parser, headers)
+            value = func(*args, budget=budget) if budget is not None else func(*args)
+            if budget is None or budget.truncated is None:
+                self.store(key, value)
+        return value
+
+    def extract_text(self, html, parser=None, headers=None, budget=None):
+        return self.call(boilerpot.extract_text, html, parser, headers, budget)
+
+    def meat(self, html, parser=None):
+        return self.call(boilerpot.meat, html, parser)
+
+    def meat2(self, html, parser=None):
+        return self.call(boilerpot.meat2, html, parser)
+
+    @property
+    def stats(self):
+        stats = {'hits': self.hits, 'misses': self.misses, 'memory': len(self.memory)}
+        if self.disk is not None:
+            stats['disk'] = len(self.disk)
+        return stats
+
+    def __getstate__(self):
+        # ship the settings, not the contents
+        state = self.__dict__.copy()
+        state['memory'] = LRUCache(self.maxsize)
+        state['hits'] = state['misses'] = 0
+        return state
@@ -16,41 +16,34 @@
 import functools
 import re
 
-try:
-    from nltk.metrics.distance import edit_distance
-except ImportError:
-    # nltk not installed, punt
-    def edit_distance(a, b):
-        return len(set(a) ^ set(b)) + abs(len(a) - len(b))
-
-def translate_microsoft(txt):
-    """ turn word document ungliness into ascii """
+# word document ungliness -> ascii
+microsoft = {
     # double quotes
-    txt = txt.replace(u"\u201c", '"')
-    txt = txt.replace(u"\u201d", '"')
+    u"\u201c": u'"',
+    u"\u201d": u'"',
     # signle quotes
-    txt = txt.replace(u"\u2018", "'")
-    txt = txt.replace(u"\u2019", "'")
-    txt = txt.replace(u"\u02BC", "'")
+    u"\u2018": u"'",
+    u"\u2019": u"'",
+    u"\u02BC": u"'",
     # invisible spaces.  So nothings - nothings that take up space.
-    txt = txt.replace(u"\u2063", " ")
+    u"\u2063": u" ",
     # these are ... and then the guy farted, right in front of the priest!
-    txt = txt.replace(u"\u2026", "...")
+    u"\u2026": u"...",
     # bullets
-    txt = txt.replace(u"\u2022", "-")
-    txt = txt.replace(u"\u25cf", "-")
+    u"\u2022": u"-",
+    u"\u25cf": u"-",
     # longdash
-    txt = txt.replace(u"\u2012", "-")
-    txt = txt.replace(u"\u2013", "-")
-    txt = txt.replace(u"\u2014", "-")
-    txt = txt.replace(u"\u2015", "-")
-    txt = txt.replace(u"\u2053", "-")
-    txt = txt.replace(u"\u2E3A", "-")
-    txt = txt.replace(u"\u2E3B", "-")
+    u"\u2012": u"-",
+    u"\u2013": u"-",
+    u"\u2014": u"-",
+    u"\u2015": u"-",
+    u"\u2053": u"-",
+    u"\u2E3A": u"-",
+    u"\u2E3B": u"-",
     # a space is a space
-    txt = txt.replace(u"\u2025", ' ')
-    txt = txt.replace(u"\xa0", ' ')
-    return txt
+    u"\u2025": u" ",
+    u"\xa0": u" ",
+}
 
 entities = {'nbsp': ' ',
             'mdash': '-',
@@ -61,20 +54,79 @@ entities = {'nbsp': ' ',
             'rdquo': '"',
            }
 
+# runs of spaces/tabs/newlines that need rewriting.  A lone space or a lone
+# newline is already fine and doesn't match.
+whitespace_re = re.compile('[ \t]+\n[ \t\n]*|\n[ \t\n]+|[ \t]{2,}|\t')
+
+def _whitespace(m):
+    # any run with newlines loses its spaces and every pair of newlines
+    # becomes one, a run without newlines becomes one space
+    newlines = m.group().count('\n')
+    if newlines:
+        return '\n' * ((newlines + 1) // 2)
+    return ' '
+
+class Normalizer(object):
+    """ clean_html() in three precompiled scans instead of a couple dozen
+        replace() and re.sub() passes.  Add to the tables by passing your own,
+        eg Normalizer(chars=dict(microsoft, **{u'\xad': u''}))
+    """
+    def __init__(self, chars=microsoft, entities=entities):
+        self.chars = dict(chars)
+        self.entities = dict(entities)
+        # an empty table has nothing to scan for, [] and &(); aren't that
+        self.chars_re = None
+        if self.chars:
+            self.chars_re = re.compile(u'[%s]' % u''.join(map(re.escape, self.chars)), re.UNICODE)
+        numbers = '&#([xX]?)([0-9a-fA-F]+);'
+        if self.entities:
+            names = '|'.join(map(re.escape, sorted(self.entities)))
+            self.entities_re = re.compile('%s|&(%s);' % (numbers, names))
+            self.names_re = re.compile('&(%s);' % names)
+        else:
+            self.entities_re = re.compile(numbers + '()')
+            self.names_re = None
+
+    def _char(self, m):
+        return self.chars[m.group()]
+
+    def _entity(self, m):
+        ishex, number, name = m.groups()
+        if name:
+            return self.entities[name]
+        return unichr(int(number, base=(16 if (ishex) else 10)))
+
+    def _name(self, m):
+        return self.entities[m.group(1)]
+
+    def translate_html_entities(self, html):
+        if '&' not in html:
+            return html
+        text = self.entities_re.sub(self._entity, html)
+        if '&#' in html and '&' in text and self.names_re is not None:
+            # a numeric reference can spell out a named one, "&#38;nbsp;"
+            text = self.names_re.sub(self._name, text)
+        return text
+
+    def translate_chars(self, txt):
+        if self.chars_re is None:
+            return unicode(txt)
+        return self.chars_re.sub(self._char, unicode(txt))
+
+    def translate_whitespace(self, txt):
+        return whitespace_re.sub(_whitespace, txt)
+
+    def __call__(self, html):
+        return self.translate_whitespace(self.translate_chars(self.translate_html_entities(html)))
+
+normalize = Normalizer()
+
+def translate_microsoft(txt):
+    """ turn word document ungliness into ascii """
+    return normalize.translate_chars(txt)
+
 def translate_html_entities(html):
-    parts = []
-    curr = 0
-    for m in re.finditer('&#([xX]?)([0-9a-fA-F]+);', html):
-        parts.append(html[curr:m.start()])
-        ishex, number = m.groups()
-        value = unichr(int(number, base=(16 if (ishex) else 10)))
-        parts.append(value)
-        curr = m.end()
-    parts.append(html[curr:])
-    html = ''.join(parts)
-    for code, translation in entities.items():
-        html = html.replace('&%s;' % code, translation)
-    return html
+    return normalize.translate_html_entities(html)
 
 def translate_nurses(txt):
     txt = txt.replace('\r\n', '\n')
@@ -82,16 +134,12 @@ def translate_nurses(txt):
     return txt
 
 def translate_whitespace(txt):
-    txt = txt.replace('\t', ' ')
-    txt = re.sub(' +', ' ', txt)
-    txt = txt.replace(' \n', '\n')
-    txt = txt.replace('\n ', '\n')
-    txt = re.sub(' +', ' ', txt)
-    txt = txt.replace('\n\n', '\n')
-    return txt
+    return whitespace_re.sub(_whitespace, txt)
 
 def clean_html(html):
-    return translate_whitespace(translate_microsoft(translate_html_entities(html)))
+    return normalize(html)
+
+non_letters_re = re.compile('[^a-z]+')
 
 def strip_letters(raw, letters):
     """ this looks questionable. """
@@ -103,16 +151,52 @@ def strip_letters(raw, letters):
         iraw += 1
     return raw[iraw:]
 
+def edit_distance(a, b):
+    """ Levenshtein distance, same answer as nltk's edit_distance() """
+    prev = range(len(b) + 1)
+    for i, ca in enumerate(a, 1):
+        curr = [i]
+        for j, cb in enumerate(b, 1):
+            curr.append(min(prev[j] + 1, curr[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = curr
+    return prev[-1]
+
+def prefix_distances(a, b, limit):
+    """ yield (i, edit_distance(a[:i], b[:i])) for the i where that is at
+        most limit, from one DP over a and b.  Only a band limit wide either
+        side of the diagonal is filled in, nothing outside it can be that
+        close, and it stops as soon as no longer prefix can be either.
+    """
+    n = min(len(a), len(b))
+    far = limit + 1
+    prev = [j if j <= limit else far for j in range(n + 1)]
+    for i in range(1, n + 1):
+        curr = [far] * (n + 1)
+        lo, hi = max(1, i - limit), min(n, i + limit)
+        if i <= limit:
+            curr[0] = i
+        ca = a[i - 1]
+        for j in range(lo, hi + 1):
+            d = min(prev[j] + 1, curr[j - 1] + 1, prev[j - 1] + (ca != b[j - 1]))
+            curr[j] = d if d < far else far
+        if curr[i] <= limit:
+            yield i, curr[i]
+        if min(curr[lo - 1:hi + 1]) > limit:
+            return  # distances never go down
+        prev = curr
+
 def strip_words(text, strip_this):
     """ if text starts with something that looks like stip_this then strip it """
-    letters = functools.partial(re.sub, '[^a-z]+', '')
+    letters = functools.partial(non_letters_re.sub, '')
     ltext = letters(text.lower())
     lstrip = letters(strip_this.lower())
 
+    # only prefixes within 10% of each other count, so nothing further apart
+    # than a tenth of the longest one needs working out
+    n = min(50, len(ltext), len(lstrip))
     best = (4, 0, '')
-    for i in range(1, 1 + min(50, len(ltext), len(lstrip))):
-        a, b = ltext[:i], lstrip[:i]
-        score = (float(edit_distance(a, b)) / len(b), -len(b), b)
+    for i, distance in prefix_distances(ltext[:n], lstrip[:n], n // 10):
+        score = (float(distance) / i, -i, lstrip[:i])
         if score < best:
             best = score
     density, length, letters = best
@@ -120,19 +204,25 @@ def strip_words(text, strip_this):
         return text
     return strip_letters(text, letters).lstrip(' .?;:()-\t\n')
 
+partial_sentence_re = re.compile('^[^.?]{0,10}(\.|\?)\s*')
+
 def strip_partial_sentence(text):
-    return re.sub('^[^.?]{0,10}(\.|\?)\s*', '', text)
+    return partial_sentence_re.sub('', text)
+
+timestamps = [re.compile(pattern, re.IGNORECASE) for pattern in [
+    '(\d{1,2}\D+20\d\d)',
+    '(\d{1,2}(:\d\d)+\s*(AM|PM|a\.m\.|p\.m\.)?\s*(ET|EST|EDT|PT|PST|PDT|CT|CST|CDT)?)',
+    '(\d{1,2}(:\d\d)*\s*(AM|PM|A\.M\.|P\.M\.)?\s*(ET|EST|EDT|PT|PST|PDT|CT|CST|CDT))',
+    ]]
 
 def strip_timestamp(text):
     """ try to remove things that look like dates at the start of text """
     # u"Published Thursday, Dec. 20, 2012 7:00AM EST With the so-called Mayan"
     # u'Garden City, NY (PRWEB) December 18, 2012 This weekend Bob Smith'
     best = 0
-    regexps = ['(\d{1,2}\D+20\d\d)',
-               '(\d{1,2}(:\d\d)+\s*(AM|PM|a\.m\.|p\.m\.)?\s*(ET|EST|EDT|PT|PST|PDT|CT|CST|CDT)?)',
-               '(\d{1,2}(:\d\d)*\s*(AM|PM|A\.M\.|P\.M\.)?\s*(ET|EST|EDT|PT|PST|PDT|CT|CST|CDT))',
-              ]
-    for pattern, m in [(pattern, re.search(pattern, text[:50], re.IGNORECASE)) for pattern in regexps]:
+    start = text[:50]
+    for regexp in timestamps:
+        m = regexp.search(start)
         if m:
             best = max(best, m.end())
     return text[best:].strip()
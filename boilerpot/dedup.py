@@ -0,0 +1,164 @@
+"""
+ Copyright Curata, Inc c/o Jack Diederich
+
+ The author licenses this file to You under the Apache License, Version 2.0
+ (the "License"); you may not use this file except in compliance with
+ the License.  You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ Near-duplicate bodies.  A syndicated wire story comes out of every site
+ that runs it with a byline or a closing line changed at most.
+ DuplicateIndex finds the first body added that shares most of its three
+ word shingles with a new one.
+
+    index = DuplicateIndex('bodies.db')
+    title, body = extract_text(html)
+    original = index.add(url, body)
+    if original is not None:
+        pass  # url is a copy of original
+
+ The fingerprint is a MinHash: every shingle is hashed once and lands in
+ one of hashes bins, each bin keeps its smallest hash.  Two bodies have the
+ same value in a bin about as often as their shingles overlap.  The bins
+ are cut into bands and an index lookup is one equality match per band, so
+ it costs the same with a few thousand bodies indexed as with tens of
+ millions.  Near-duplicates are sure to share a band, the candidates that
+ do are checked against threshold.
+"""
+import hashlib
+import struct
+
+from .boilerpot import word_re
+from .cache import SqliteStore
+
+unpack = struct.Struct('<Q').unpack
+
+def shingles(text, size=3):
+    """ the distinct runs of size words in text """
+    words = word_re.findall(text.lower())
+    return set(u' '.join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1)))
+
+def minhash(text, hashes=32, size=3):
+    """ hashes 32 bit values, the smallest hash of the shingles in each bin """
+    empty = 1 << 64
+    mins = [empty] * hashes
+    md5 = hashlib.md5
+    for gram in shingles(text, size):
+        h, = unpack(md5(gram.encode('utf-8')).digest()[:8])
+        i = h % hashes
+        if h < mins[i]:
+            mins[i] = h
+    if empty in mins and len(set(mins)) > 1:
+        # an empty bin borrows from the next full one along, shifted by how
+        # far it had to look (densified one permutation hashing)
+        filled = []
+        for i in range(hashes):
+            step = 0
+            while mins[(i + step) % hashes] == empty:
+                step += 1
+            filled.append(mins[(i + step) % hashes] + step * 0x9e3779b97f4a7c15)
+        mins = filled
+    return [value // hashes & 0xffffffff for value in mins]
+
+def similarity(a, b):
+    """ the share of bins two minhashes agree on, about the share of shingles
+        the bodies have in common
+    """
+    return sum(x == y for x, y in zip(a, b)) / float(len(a))
+
+def signed(value):
+    # sqlite integers are signed 64 bit
+    return value - (1 << 64) if value >> 63 else value
+
+class DuplicateIndex(SqliteStore):
+    """ the minhashes of the bodies added so far, in sqlite so it persists and
+        any number of processes can share one file.  A body is a duplicate of
+        the earliest body added whose minhash agrees with it on at least
+        threshold of the bins.  Duplicates aren't added themselves, the
+        original stands in for all of them.
+
+        bands * rows bins are kept.  More rows per band makes the lookups
+        pickier; bodies sharing less than about (1 / bands) ** (1.0 / rows)
+        of their shingles rarely come up as candidates at all.  An index has
+        to be opened with the bands and rows it was made with.
+
+        Bodies under minwords words are never duplicates, there isn't enough
+        in them to tell a copy from a coincidence.
+    """
+    def __init__(self, path=':memory:', threshold=0.8, bands=8, rows=4, minwords=20):
+        self.path = path
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = rows
+        self.minwords = minwords
+        self.hashes = bands * rows
+        self.format = '<%dI' % self.hashes  # a Struct won't pickle
+        self.lookup_sql = ' UNION ALL '.join('SELECT rowid, doc, minhash FROM bodies WHERE b%d = ?' % band
+                                             for band in range(bands))
+        self.insert_sql = 'INSERT INTO bodies VALUES (?, ?%s)' % (', ?' * bands)
+
+    def setup(self, db):
+        db.execute('CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value INTEGER)')
+        for name in ['bands', 'rows']:
+            db.execute('INSERT OR IGNORE INTO settings VALUES (?, ?)', (name, getattr(self, name)))
+            value, = db.execute('SELECT value FROM settings WHERE name = ?', (name,)).fetchone()
+            if value != getattr(self, name):
+                raise ValueError('%s was made with %s=%d' % (self.path, name, value))
+        columns = ''.join(', b%d INTEGER' % band for band in range(self.bands))
+        db.execute('CREATE TABLE IF NOT EXISTS bodies (doc, minhash BLOB%s)' % columns)
+        for band in range(self.bands):
+            db.execute('CREATE INDEX IF NOT EXISTS bodies_b%d ON bodies (b%d)' % (band, band))
+
+    def keys(self, signature):
+        """ a 64 bit hash of each band's rows """
+        packed = struct.pack(self.format, *signature)
+        width = self.rows * 4
+        return [signed(unpack(hashlib.md5(chr(band) + packed[band * width:(band + 1) * width]).digest()[:8])[0])
+                for band in range(self.bands)]
+
+    def matches(self, signature):
+        """ the docs signature is a near-duplicate of, earliest first """
+        found = {}
+        for rowid, doc, other in self.db.execute(self.lookup_sql, self.keys(signature)):
+            if rowid not in found and similarity(signature, struct.unpack(self.format, str(other))) >= self.threshold:
+                found[rowid] = doc
+        return [doc for rowid, doc in sorted(found.items())]
+
+    def find(self, signature):
+        """ the earliest doc that signature is a near-duplicate of, or None """
+        matches = self.matches(signature)
+        return matches[0] if matches else None
+
+    def signature(self, body):
+        """ body's minhash, None if it is too short to count """
+        if len(word_re.findall(body)) < self.minwords:
+            return None
+        return minhash(body, self.hashes)
+
+    def lookup(self, body):
+        """ the doc body is a duplicate of, or None """
+        signature = self.signature(body)
+        return signature and self.find(signature)
+
+    def add(self, doc, body):
+        """ the doc body is a duplicate of, or None after adding it as doc.
+            Adding a doc again finds its own entry, that isn't a duplicate.
+        """
+        signature = self.signature(body)
+        if signature is None:
+            return None
+        matches = self.matches(signature)
+        if not matches:
+            self.db.execute(self.insert_sql, [doc, buffer(struct.pack(self.format, *signature))] + self.keys(signature))
+        others = [match for match in matches if match != doc]
+        return others[0] if others else None
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM bodies').fetchone()[0]
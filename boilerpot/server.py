@@ -0,0 +1,254 @@
+"""
+ Copyright Curata, Inc c/o Jack Diederich
+
+ The author licenses this file to You under the Apache License, Version 2.0
+ (the "License"); you may not use this file except in compliance with
+ the License.  You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ python -m boilerpot serve [options]
+
+ extract_text() over HTTP.  POST the raw page (gzip is fine) to /extract and
+ get back {"title": ..., "body": ..., "timings": {...}}.  The Content-Type
+ charset of the request is used to decode it, ?parser= picks the backend.
+ GET /metrics has the counters and latency histograms.
+
+ Requests are handled in threads and extracted by a pool of worker processes,
+ each of which warms up on a throwaway page as it starts.  At most max_pending
+ requests are in flight, past that the answer is 429 until some finish.  A
+ request that runs over the timeout gets a 504.  With a CPU budget a page
+ that uses it up gets the largest paragraph parsed by then instead of the
+ full filters, and "degraded": true.
+
+ Service.handle() is all the HTTP server calls, so it can be driven without
+ a socket:
+
+    service = Service(workers=0)  # extract in the calling thread
+    status, doc = service.handle('POST', '/extract', {}, html)
+"""
+import BaseHTTPServer
+import collections
+import json
+import multiprocessing
+import optparse
+import signal
+import SocketServer
+import sys
+import threading
+import time
+import urlparse
+
+from .boilerpot import extract_text, parsers, Budget
+from .batch import Timeout, _init_worker, _timed_out
+from .trace import Histogram, Tracer, tracing
+
+warmup = '<html><head><title>warm</title></head><body><p>%s</p></body></html>' % ('Warm up. ' * 40)
+
+def _init_server_worker():
+    _init_worker()
+    # the first call pays for imports and compiling, not the first request
+    extract_text(warmup)
+
+def _work(html, headers, parser, timeout, cpu_budget=None, clock=None):
+    start = time.time()
+    tracer = Tracer()
+    # with a timeout a Budget gets lxml a target the alarm can stop
+    budget = Budget(stop_at_end=False, max_seconds=cpu_budget, clock=clock) if cpu_budget or timeout else None
+    if timeout:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        with tracing(tracer):
+            title, body = extract_text(html, parser, headers, budget=budget)
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    _timed_out(budget)
+    stages = collections.defaultdict(float)
+    for stage, seconds, blocks, rss in tracer.stages:
+        stages[stage] += seconds
+    return title, body, time.time() - start, dict(stages), bool(budget and budget.degraded)
+
+class Service(object):
+    """ the extraction pool and everything the endpoints need.  workers=0
+        extracts in the calling thread, without timeouts.  cpu_budget is the
+        Budget.max_seconds for each page.  With workers=0 it is wall time
+        from the start of the page, the request threads share one process
+        so its CPU time is everyone's.
+    """
+    def __init__(self, workers=None, max_pending=None, timeout=30.0, parser=None, max_bytes=32 << 20,
+                 cpu_budget=None):
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        self.workers = workers
+        self.max_pending = max_pending or 4 * max(workers, 1)
+        self.timeout = timeout
+        self.parser = parser
+        self.max_bytes = max_bytes
+        self.cpu_budget = cpu_budget
+        self.pool = multiprocessing.Pool(workers, _init_server_worker) if workers else None
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+        self.lock = threading.Lock()
+        self.counts = collections.Counter()
+        self.in_flight = 0
+        self.latency = Histogram()
+        self.stages = collections.defaultdict(Histogram)
+        self.started = time.time()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def extract(self, html, headers=None, parser=None):
+        """ (status, doc) for one page """
+        parser = parser or self.parser
+        if parser is not None and parser not in parsers:
+            return 400, {'error': 'unknown parser %r' % parser}
+        if not self.slots.acquire(False):
+            self.count('rejected')
+            return 429, {'error': 'too many requests in flight'}
+        with self.lock:
+            self.in_flight += 1
+        start = time.time()
+        try:
+            if self.pool is None:
+                title, body, seconds, stages, degraded = _work(html, headers, parser, None, self.cpu_budget,
+                                                               time.time)
+            else:
+                job = self.pool.apply_async(_work, (html, headers, parser, self.timeout, self.cpu_budget))
+                # the worker gives up at timeout, this is in case it can't
+                title, body, seconds, stages, degraded = job.get(self.timeout + 5 if self.timeout else None)
+        except (Timeout, multiprocessing.TimeoutError):
+            self.count('timeouts')
+            return 504, {'error': 'extraction took too long'}
+        except Exception, e:
+            self.count('errors')
+            return 500, {'error': '%s: %s' % (e.__class__.__name__, e)}
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+            self.slots.release()
+        total = time.time() - start
+        with self.lock:
+            self.counts['ok'] += 1
+            if degraded:
+                self.counts['degraded'] += 1
+            self.latency.add(total)
+            for stage, stage_seconds in stages.items():
+                self.stages[stage].add(stage_seconds)
+        timings = {'total': total, 'queue': max(total - seconds, 0.0), 'extract': seconds, 'stages': stages}
+        return 200, {'title': title, 'body': body, 'degraded': degraded, 'timings': timings}
+
+    def metrics(self):
+        with self.lock:
+            return {'uptime': time.time() - self.started,
+                    'workers': self.workers,
+                    'max_pending': self.max_pending,
+                    'in_flight': self.in_flight,
+                    'counts': dict(self.counts),
+                    'latency': self.latency.as_dict(),
+                    'stages': dict((stage, hist.as_dict()) for stage, hist in self.stages.items()),
+                    }
+
+    def handle(self, method, path, headers, body=''):
+        """ one request.  headers have lowercase names, returns (status, doc) """
+        url = urlparse.urlparse(path)
+        self.count('requests')
+        if url.path == '/metrics' and method == 'GET':
+            return 200, self.metrics()
+        if url.path in ('/', '/extract'):
+            if method != 'POST':
+                return 405, {'error': 'POST the page to %s' % url.path}
+            if len(body) > self.max_bytes:
+                self.count('too_large')
+                return 413, {'error': 'page is over %d bytes' % self.max_bytes}
+            query = urlparse.parse_qs(url.query)
+            parser = query.get('parser', [None])[0]
+            page_headers = dict((name, headers[name]) for name in ['content-type', 'content-encoding']
+                                if name in headers)
+            return self.extract(body, page_headers, parser)
+        return 404, {'error': 'no such endpoint %s' % url.path}
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'boilerpot'
+
+    def do_GET(self):
+        self.respond(self.server.service.handle('GET', self.path, self.request_headers()))
+
+    def do_POST(self):
+        length = int(self.headers.get('content-length') or 0)
+        # one byte over is enough for handle() to turn it down
+        body = self.rfile.read(min(length, self.server.service.max_bytes + 1))
+        if len(body) < length:
+            self.close_connection = True
+        self.respond(self.server.service.handle('POST', self.path, self.request_headers(), body))
+
+    def request_headers(self):
+        return dict((name.lower(), value) for name, value in self.headers.items())
+
+    def respond(self, response):
+        status, doc = response
+        data = json.dumps(doc)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        if status == 429:
+            self.send_header('Retry-After', '1')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service, verbose=False):
+        BaseHTTPServer.HTTPServer.__init__(self, address, Handler)
+        self.service = service
+        self.verbose = verbose
+
+def main(argv):
+    op = optparse.OptionParser(usage='python -m boilerpot serve [options]')
+    op.add_option('--host', default='127.0.0.1', help='address to listen on (default: %default)')
+    op.add_option('--port', type='int', default=8080, help='port to listen on (default: %default)')
+    op.add_option('-j', '--workers', type='int', help='extraction processes (default: one per CPU)')
+    op.add_option('-q', '--max-pending', type='int', help='requests in flight before 429s (default: 4 per worker)')
+    op.add_option('-t', '--timeout', type='float', default=30.0, help='seconds per request (default: %default)')
+    op.add_option('-p', '--parser', help='default parser backend')
+    op.add_option('--cpu-budget', type='float', metavar='SECONDS',
+                  help='CPU seconds per page before falling back to the largest paragraph '
+                       '(wall seconds with -j 0)')
+    op.add_option('-v', '--verbose', action='store_true', help='log every request')
+    options, args = op.parse_args(argv)
+    if args:
+        op.error('unexpected arguments %r' % args)
+
+    service = Service(options.workers, options.max_pending, options.timeout, options.parser,
+                      cpu_budget=options.cpu_budget)
+    server = Server((options.host, options.port), service, options.verbose)
+    sys.stderr.write('boilerpot serving on http://%s:%d/ with %d workers\n' % (
+        options.host, server.server_address[1], service.workers))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
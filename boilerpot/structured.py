@@ -0,0 +1,239 @@
+"""
+ Copyright Curata, Inc c/o Jack Diederich
+
+ The author licenses this file to You under the Apache License, Version 2.0
+ (the "License"); you may not use this file except in compliance with
+ the License.  You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ Every block of a page as the rules left it, not just the body: where its
+ text is, its tags and ids, its labels and the counts the rules went by.
+ Extract once, save the pages and let any number of jobs read them back.
+
+    with open('pages.blocks', 'ab') as f:
+        for html in pages:
+            write_page(f, extract_blocks(html))
+
+    with open('pages.blocks', 'rb') as f:
+        for page in read_pages(f):
+            for block in page.blocks:
+                if block.flags & label.heading and not block.ignore:
+                    print block.text(page.text)
+
+ page.text is the text of all the blocks one after the other with a space
+ in between, the spans are (start, end) offsets into it.  A block the rules
+ merged others into has a span for each run of them, the blocks merged in
+ are still there marked ignore.  page.body is the cleaned up text of
+ page.blocks[page.best].
+
+ write_page() is length-prefixed binary: the blocks are stored a column at
+ a time and every string and tag once per page.  write_json() is one
+ JSON object a line.  Either way a file is just pages one after the other,
+ so it can be appended to and read back as a stream.
+"""
+import collections
+import json
+import struct
+
+from . import boilerpot
+from .boilerpot import label, label_names, Path
+
+Page = collections.namedtuple('Page', 'title body text best truncated degraded blocks')
+
+class Block(collections.namedtuple('Block', 'spans depth ignore tags ids flags wordcount linecount '
+                                            'link_density word_density')):
+    __slots__ = ()
+
+    def text(self, text):
+        """ the block's text, given its page.text """
+        return u' '.join([text[start:end] for start, end in self.spans])
+
+    @property
+    def start(self):
+        return self.spans[0][0]
+
+    @property
+    def end(self):
+        return self.spans[-1][1]
+
+    @property
+    def labels(self):
+        return frozenset(name for value, name in label_names.items() if self.flags & value)
+
+    @property
+    def is_content(self):
+        return self.flags & (label.content | label.ignore) == label.content
+
+def page_blocks(page, strategies=boilerpot.strategies):
+    """ a Page for a page from parse_page() or Extractor.finish(), with the
+        blocks from the strategy extract_page() would take the body from
+    """
+    filtered, title, body = boilerpot.best_filter(page, strategies)
+    blocks = filtered.blocks
+    best = getattr(filtered, 'best', None)
+    best = [i for i, block in enumerate(blocks) if block is best][0] if best is not None else None
+    return Page(title, body, filtered.doc.text, best, filtered.truncated, filtered.degraded,
+                [Block(block.spans, block.depth, block.ignore, block.tags, block.ids, block.flags,
+                       block.wordcount, block.linecount, block.link_density, block.word_density)
+                 for block in blocks])
+
+def extract_blocks(html, parser=None, headers=None, site=None, budget=None):
+    """ extract_text(), returning the Page instead of (title, body) """
+    if boilerpot.traced.tracer is not None:
+        boilerpot.traced.tracer.begin()
+    html = boilerpot.timed('decode', boilerpot.decode_data, html, headers or {})
+    return page_blocks(boilerpot.parse_page(html, parser, site, budget))
+
+# 'bp', the format version and how many bytes of page follow
+header = struct.Struct('<2sBI')
+version = 1
+# title, body, text and truncated (string numbers), best, degraded, then
+# how many strings, tag paths, blocks and spans there are
+counts = struct.Struct('<10i')
+
+def pack_column(code, values):
+    return struct.pack('<%d%s' % (len(values), code), *values)
+
+def encode(page):
+    """ the page as bytes, without the header """
+    strings = {}
+    def string(value):
+        if value is None:
+            return -1
+        return strings.setdefault(value, len(strings))
+    # the tag paths are a tree, each is stored as its parent's number and a
+    # name, so a page nested thousands deep doesn't take thousands per block
+    paths, numbers = {}, {}
+    parents, names, made = [], [], []
+    def path(node):
+        if not isinstance(node, Path):
+            node = Path.of(node)
+            made.append(node)  # so its id isn't reused
+        new = []
+        while node.length and id(node) not in paths:
+            new.append(node)
+            node = node.parent
+        number = paths.get(id(node), -1)
+        for node in reversed(new):
+            key = number, string(node.name)
+            if key not in numbers:
+                parents.append(number)
+                names.append(key[1])
+                numbers[key] = len(parents) - 1
+            number = paths[id(node)] = numbers[key]
+        return number
+
+    title, body, text, truncated = map(string, [page.title, page.body, page.text, page.truncated])
+    blocks = page.blocks
+    columns = [[block.depth for block in blocks],
+               [block.ignore for block in blocks],
+               [block.flags for block in blocks],
+               [block.wordcount for block in blocks],
+               [block.linecount for block in blocks],
+               [path(block.tags) for block in blocks],
+               [path(block.ids) for block in blocks],
+               [len(block.spans) for block in blocks]]
+    spans = [offset for block in blocks for span in block.spans for offset in span]
+
+    encoded = [unicode(value).encode('utf-8') for value, i in sorted(strings.items(), key=lambda item: item[1])]
+    best = -1 if page.best is None else page.best
+    out = [counts.pack(title, body, text, truncated, best, page.degraded,
+                       len(encoded), len(parents), len(blocks), len(spans)),
+           pack_column('I', map(len, encoded)), ''.join(encoded),
+           pack_column('i', parents), pack_column('I', names)]
+    out.extend(pack_column('I', column) for column in columns)
+    out.append(pack_column('d', [block.link_density for block in blocks]))
+    out.append(pack_column('d', [block.word_density for block in blocks]))
+    out.append(pack_column('I', spans))
+    return ''.join(out)
+
+def decode(data):
+    """ encode() backwards """
+    offset = [0]
+    def column(code, n):
+        values = struct.unpack_from('<%d%s' % (n, code), data, offset[0])
+        offset[0] += struct.calcsize('<%d%s' % (n, code))
+        return values
+
+    title, body, text, truncated, best, degraded, nstrings, npaths, nblocks, nspans = counts.unpack_from(data)
+    offset[0] = counts.size
+    strings = []
+    for length in column('I', nstrings):
+        strings.append(data[offset[0]:offset[0] + length].decode('utf-8'))
+        offset[0] += length
+    root = Path()
+    paths = []
+    for parent, name in zip(column('i', npaths), column('I', npaths)):
+        paths.append(Path(strings[name], paths[parent] if parent >= 0 else root))
+    paths.append(root)  # number -1
+
+    depth, ignore, flags, wordcount, linecount, tags, ids, span_counts = [column('I', nblocks) for i in range(8)]
+    link_density, word_density = column('d', nblocks), column('d', nblocks)
+    offsets = column('I', nspans)
+    blocks, start = [], 0
+    for i in range(nblocks):
+        end = start + 2 * span_counts[i]
+        spans = zip(offsets[start:end:2], offsets[start + 1:end:2])
+        blocks.append(Block(spans, depth[i], ignore[i], paths[tags[i]], paths[ids[i]], flags[i],
+                            wordcount[i], linecount[i], link_density[i], word_density[i]))
+        start = end
+    string = lambda i: None if i < 0 else strings[i]
+    return Page(string(title), string(body), string(text), None if best < 0 else best, string(truncated),
+                bool(degraded), blocks)
+
+def write_page(f, page):
+    data = encode(page)
+    f.write(header.pack('bp', version, len(data)))
+    f.write(data)
+
+def read_pages(f):
+    """ the pages write_page() wrote to f, one at a time """
+    while True:
+        head = f.read(header.size)
+        if not head:
+            return
+        if len(head) < header.size:
+            raise ValueError('truncated page header')
+        magic, format, length = header.unpack(head)
+        if magic != 'bp' or format != version:
+            raise ValueError('not a boilerpot blocks file (or a newer one)')
+        data = f.read(length)
+        if len(data) < length:
+            raise ValueError('truncated page')
+        yield decode(data)
+
+def as_dict(page):
+    doc = page._asdict()
+    doc['blocks'] = [dict(block._asdict(), labels=sorted(block.labels), spans=map(list, block.spans),
+                          tags=list(block.tags), ids=list(block.ids))
+                     for block in page.blocks]
+    for block in doc['blocks']:
+        del block['flags']
+    return doc
+
+def from_dict(doc):
+    blocks = []
+    for block in doc['blocks']:
+        flags = 0
+        for name in block['labels']:
+            flags |= getattr(label, name)
+        blocks.append(Block(map(tuple, block['spans']), block['depth'], block['ignore'], Path.of(block['tags']),
+                            Path.of(block['ids']), flags, block['wordcount'], block['linecount'],
+                            block['link_density'], block['word_density']))
+    return Page(doc['title'], doc['body'], doc['text'], doc['best'], doc['truncated'], doc['degraded'], blocks)
+
+def write_json(f, page):
+    f.write(json.dumps(as_dict(page)) + '\n')
+
+def read_json(f):
+    """ the pages write_json() wrote to f, one at a time """
+    for line in f:
+        if line.strip():
+            yield from_dict(json.loads(line))
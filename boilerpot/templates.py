@@ -0,0 +1,117 @@
+"""
+ Copyright Curata, Inc c/o Jack Diederich
+
+ The author licenses this file to You under the Apache License, Version 2.0
+ (the "License"); you may not use this file except in compliance with
+ the License.  You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ Per-site templates.  Pages from one host repeat the same navigation, footer
+ and sidebar blocks; once a block has turned up on most of the pages seen for
+ a host it is marked ignore and left out of the filter chain entirely.
+
+    index = TemplateIndex.load('sites.json')
+    title, body = extract_text(html, site=index.site('example.com'))
+    index.save('sites.json')
+"""
+import collections
+import functools
+import hashlib
+import json
+
+from .boilerpot import label
+
+def fingerprint(block):
+    """ where the block sits (tags and ids) plus what it says """
+    text = u' '.join(block.text.lower().split())
+    key = u'%s\0%s\0%s' % (u'/'.join(block.tags), u'/'.join(block.ids), text)
+    return hashlib.md5(key.encode('utf-8')).hexdigest()[:16]
+
+class Host(object):
+    """ the pages counted for one host and how many of them had each block """
+    def __init__(self, pages=0, blocks=None):
+        self.pages = pages
+        self.blocks = blocks or {}
+
+    def learn(self, prints, max_blocks):
+        # a block repeated on the page only counts once
+        prints = frozenset(prints)
+        self.pages += 1
+        blocks = self.blocks
+        for fp in prints:
+            blocks[fp] = blocks.get(fp, 0) + 1
+        if len(blocks) > max_blocks:
+            # the rare ones go, chrome is on every page and keeps a high count
+            keep = sorted(blocks.items(), key=lambda item: item[1], reverse=True)[:max_blocks // 2]
+            self.blocks = dict(keep)
+
+class TemplateIndex(object):
+    """ block fingerprints by host.  A block is chrome once the host has
+        min_pages pages counted and the block was on at least share of them.
+
+        Memory is bounded: at most max_hosts hosts (least recently used go
+        first) and max_blocks fingerprints per host (the least common go).
+    """
+    def __init__(self, share=0.6, min_pages=5, max_hosts=10000, max_blocks=2000):
+        self.share = share
+        self.min_pages = min_pages
+        self.max_hosts = max_hosts
+        self.max_blocks = max_blocks
+        self.hosts = collections.OrderedDict()
+
+    def host(self, name):
+        try:
+            host = self.hosts.pop(name)
+        except KeyError:
+            host = Host()
+        self.hosts[name] = host
+        while len(self.hosts) > self.max_hosts:
+            self.hosts.popitem(last=False)
+        return host
+
+    def filter(self, name, blocks):
+        """ mark the known chrome in blocks as ignore, learn from the page and
+            return the blocks that are left to classify
+        """
+        host = self.host(name)
+        prints = []
+        need = self.share * host.pages if host.pages >= self.min_pages else None
+        left = []
+        for block in blocks:
+            if block.ignore:
+                continue  # not_ignored drops these anyway
+            fp = fingerprint(block)
+            prints.append(fp)
+            if need is not None and host.blocks.get(fp, 0) >= need:
+                block.mark(label.ignore, 'ignore_template')
+            else:
+                left.append(block)
+        host.learn(prints, self.max_blocks)
+        return left
+
+    def site(self, name):
+        """ for the site= argument of extract_text(), meat() and friends """
+        return functools.partial(self.filter, name)
+
+    def save(self, path):
+        hosts = [(name, host.pages, host.blocks) for name, host in self.hosts.items()]
+        settings = dict(share=self.share, min_pages=self.min_pages,
+                        max_hosts=self.max_hosts, max_blocks=self.max_blocks)
+        with open(path, 'wb') as f:
+            json.dump({'settings': settings, 'hosts': hosts}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            data = json.load(f)
+        index = cls(**dict((str(k), v) for k, v in data['settings'].items()))
+        for name, pages, blocks in data['hosts']:
+            index.hosts[name] = Host(pages, dict((str(k), v) for k, v in blocks.items()))
+        return index
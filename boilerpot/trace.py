@@ -0,0 +1,189 @@
+"""
+ Copyright Curata, Inc c/o Jack Diederich
+
+ The author licenses this file to You under the Apache License, Version 2.0
+ (the "License"); you may not use this file except in compliance with
+ the License.  You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ Where the time goes, stage by stage.
+
+    with tracing() as tracer:
+        for html in pages:
+            extract_text(html)
+            if tracer.seconds() > 1.0:
+                print tracer.stages  # the slow page's breakdown
+    print tracer.report()
+    json.dump(tracer.as_dict(), f)
+
+ The stages are decode, microsoft, nurses, parse (with soup inside it for the
+ BeautifulSoup backends), every rule of the article and simple pipelines and
+ clean_body.  Nothing is timed or formatted while no tracer is installed.
+ Each thread installs its own.
+"""
+import bisect
+import contextlib
+import time
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from . import boilerpot
+
+def maxrss():
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+class Histogram(object):
+    """ counts of stage times by order of magnitude """
+    bounds = [0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0, 10.0]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.blocks = 0
+
+    def add(self, seconds, blocks=None):
+        self.counts[bisect.bisect(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.blocks += blocks or 0
+
+    def as_dict(self):
+        labels = ['<%gs' % bound for bound in self.bounds] + ['>=%gs' % self.bounds[-1]]
+        return {'count': self.count, 'total': self.total, 'max': self.max, 'blocks': self.blocks,
+                'histogram': dict(zip(labels, self.counts))}
+
+class Tracer(object):
+    """ stages holds (stage, seconds, blocks, rss_kb) for the current
+        document, histograms the totals for every document so far.  blocks is
+        how many blocks came out of the stage, rss_kb how much the peak memory
+        of the process grew during it (0 for pipeline rules, which are timed
+        block by block).
+
+        extract_text() starts a new document, call begin() yourself when
+        calling meat() or the filters directly.
+    """
+    def __init__(self):
+        self.stages = []
+        self.histograms = {}
+        self.documents = 0
+
+    def begin(self):
+        self.stages = []
+        self.documents += 1
+
+    def record(self, stage, seconds, blocks=None, rss=0):
+        self.stages.append((stage, seconds, blocks, rss))
+        if stage not in self.histograms:
+            self.histograms[stage] = Histogram()
+        self.histograms[stage].add(seconds, blocks)
+
+    def call(self, stage, func, *args):
+        rss = maxrss()
+        start = time.time()
+        result = None
+        try:
+            result = func(*args)
+            return result
+        finally:
+            # the parsers fill in the ParseState they are handed, and can stop
+            # early by raising
+            seconds = time.time() - start
+            blocks = None
+            for obj in (result,) + args:
+                if isinstance(obj, boilerpot.ParseState):
+                    blocks = len(obj.parts)
+                    break
+            self.record(stage, seconds, blocks, maxrss() - rss)
+
+    def pipeline(self, pipeline, blocks):
+        """ run a Pipeline timing each rule.  The rules are fused generators
+            pulling blocks through each other, a Clocks charges the time to
+            whichever rule is running.
+        """
+        rules = pipeline.rules
+        clocks = Clocks(len(rules))
+        stream = iter(blocks)
+        for i, rule in enumerate(rules):
+            outer = clocks.switch(i)
+            stream = rule.stream(stream)  # 'list' rules do their work right here
+            clocks.switch(outer)
+            stream = timed_stream(stream, clocks, i)
+        blocks = list(stream)
+        prefix = pipeline.name + '.' if pipeline.name else ''
+        for rule, seconds, count in zip(rules, clocks.seconds, clocks.counts):
+            self.record(prefix + rule.__name__, seconds, count)
+        return blocks
+
+    def seconds(self):
+        """ time spent in the current document, nested stages counted once """
+        return sum(seconds for stage, seconds, blocks, rss in self.stages if stage != 'soup')
+
+    def as_dict(self):
+        return {'documents': self.documents,
+                'stages': dict((stage, hist.as_dict()) for stage, hist in self.histograms.items())}
+
+    def report(self):
+        lines = ['%-40s %8s %10s %10s %10s' % ('stage', 'count', 'total', 'mean', 'max')]
+        for stage, hist in sorted(self.histograms.items(), key=lambda item: -item[1].total):
+            lines.append('%-40s %8d %10.4f %10.6f %10.6f' % (stage, hist.count, hist.total,
+                                                           hist.total / hist.count, hist.max))
+        return '\n'.join(lines)
+
+class Clocks(object):
+    """ seconds for each of a set of stages that call into each other, the
+        time goes to whichever was switched to last
+    """
+    def __init__(self, n):
+        self.seconds = [0.0] * n
+        self.counts = [0] * n
+        self.running = None
+        self.since = time.time()
+
+    def switch(self, to):
+        """ start charging to, returns who was running before """
+        now = time.time()
+        if self.running is not None:
+            self.seconds[self.running] += now - self.since
+        running, self.running, self.since = self.running, to, now
+        return running
+
+def timed_stream(stream, clocks, i):
+    """ pass blocks through charging the time spent getting each to stage i """
+    stream = iter(stream)
+    while True:
+        outer = clocks.switch(i)
+        try:
+            block = next(stream)
+        except StopIteration:
+            return
+        finally:
+            clocks.switch(outer)
+        clocks.counts[i] += 1
+        yield block
+
+@contextlib.contextmanager
+def tracing(tracer=None):
+    """ install a Tracer for the duration, pass one in to keep adding to it.
+        It only times the pages extracted in this thread.
+    """
+    tracer = tracer or Tracer()
+    traced = boilerpot.traced
+    previous, traced.tracer = traced.tracer, tracer
+    try:
+        yield tracer
+    finally:
+        traced.tracer = previous
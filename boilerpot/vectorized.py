@@ -0,0 +1,184 @@
+"""
+ Copyright Curata, Inc c/o Jack Diederich
+
+ The author licenses this file to You under the Apache License, Version 2.0
+ (the "License"); you may not use this file except in compliance with
+ the License.  You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ density_marker and content_marker as array expressions over a feature matrix
+ of the blocks, one row per block.  Several documents can be stacked with
+ their start offsets and scored in one call, filter_pages() does that for a
+ whole batch.  Without NumPy the plain rules run instead, the labels come out
+ the same either way.
+
+    pages = [parse_page(decode_data(html)) for html in batch]
+    for page in filter_pages(pages, vectorized.article_rules):
+        print article_text(page)
+"""
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from . import boilerpot
+from .boilerpot import label, rule, Pipeline
+
+columns = ['wordcount', 'linecount', 'word_density', 'link_density', 'depth', 'flags']
+
+def features(blocks, names=columns):
+    """ a record array with a row per block and the Text attributes in names
+        as the columns.  Pulling them out of the blocks is most of the work,
+        so the markers only ask for the ones they use.
+    """
+    n = len(blocks)
+    matrix = numpy.empty(n, [(name, int if name in ('flags', 'wordcount') else float)
+                             for name in names])
+    for name in names:
+        matrix[name] = numpy.fromiter((getattr(block, name) for block in blocks), matrix.dtype[name], n)
+    return matrix
+
+def boundaries(n, starts):
+    """ masks of the first and last block of every document """
+    first = numpy.zeros(n, bool)
+    last = numpy.zeros(n, bool)
+    if n:
+        starts = numpy.asarray(starts, int)
+        first[starts[starts < n]] = True
+        last[n - 1] = True
+        last[starts[(starts > 0) & (starts <= n)] - 1] = True
+    return first, last
+
+def prev_of(column, first, blank=0):
+    """ each block's previous block's value, blank (the empty Text()) at the
+        start of a document
+    """
+    shifted = numpy.empty_like(column)
+    shifted[1:] = column[:-1]
+    shifted[first] = blank
+    return shifted
+
+def next_of(column, last, blank=0):
+    shifted = numpy.empty_like(column)
+    shifted[:-1] = column[1:]
+    shifted[last] = blank
+    return shifted
+
+def density_marks(matrix, starts=(0,)):
+    """ which blocks density_marker calls content """
+    n = len(matrix)
+    first, last = boundaries(n, starts)
+    link, words = matrix['link_density'], matrix['word_density']
+    prev_link, prev_words = prev_of(link, first), prev_of(words, first)
+    next_words = next_of(words, last)
+
+    low_links = link <= 0.333333
+    decided = ~low_links | (prev_link <= 0.555556)
+    use = low_links & numpy.where(words <= 9,
+                                  numpy.where(next_words <= 10, prev_words > 4, True),
+                                  next_words != 0)
+    # when the tree doesn't decide the last block's answer sticks.  The first
+    # block of a document always decides, its prev is blank.
+    latest = numpy.maximum.accumulate(numpy.where(decided, numpy.arange(n), 0))
+    return use[latest]
+
+def content_marks(matrix, starts=(0,)):
+    """ (content1, maybe, content2, content3) masks of the blocks each of
+        content_marker's branches marks
+    """
+    n = len(matrix)
+    first, last = boundaries(n, starts)
+    link, count, flags = matrix['link_density'], matrix['wordcount'], matrix['flags']
+    prev_count, next_count = prev_of(count, first), next_of(count, last)
+
+    considered = link <= 0.333333
+    low_prev_links = prev_of(link, first) <= 0.555556
+    content1 = considered & low_prev_links & (count > 16) & (next_count > 15) & (prev_count > 4)
+    content2 = considered & ~low_prev_links & (count > 40) & (next_count > 17)
+    content3 = considered & ~low_prev_links & ~content2 & (count > 100) & \
+               (flags & label.maybe_content != 0)
+    # prev has already been through the rule when curr gets there
+    after = flags | numpy.where(content1 | content2 | content3, label.content, 0)
+    prev_content = prev_of((after & (label.content | label.ignore)) == label.content, first, False)
+    maybe = considered & low_prev_links & ~content1 & prev_content & (count > 20) & (next_count > 7)
+    return content1, maybe, content2, content3
+
+def mark(blocks, mask, flags, why):
+    for i in numpy.flatnonzero(mask):
+        blocks[i].mark(flags, why)
+
+def mark_density(blocks, starts=(0,)):
+    if numpy is None:
+        for begin, end in spans(blocks, starts):
+            list(boilerpot.density_marker.stream(iter(blocks[begin:end])))
+        return
+    matrix = features(blocks, ['link_density', 'word_density'])
+    mark(blocks, density_marks(matrix, starts), label.content, 'content_density_marker')
+
+def mark_content(blocks, starts=(0,)):
+    if numpy is None:
+        for begin, end in spans(blocks, starts):
+            list(boilerpot.content_marker.stream(iter(blocks[begin:end])))
+        return
+    matrix = features(blocks, ['wordcount', 'link_density', 'flags'])
+    content1, maybe, content2, content3 = content_marks(matrix, starts)
+    mark(blocks, content1, label.content, 'content_content_marker1')
+    mark(blocks, maybe, label.maybe_content, 'maybe_content_content_marker')
+    mark(blocks, content2, label.content, 'content_content_marker2')
+    mark(blocks, content3, label.content, 'content_content_marker3')
+
+def spans(blocks, starts):
+    ends = list(starts[1:]) + [len(blocks)]
+    return zip(starts, ends)
+
+@rule('list')
+def density_marker(blocks):
+    mark_density(blocks)
+density_marker.batch = mark_density
+
+@rule('list')
+def content_marker(blocks):
+    mark_content(blocks)
+content_marker.batch = mark_content
+
+def vectorize(pipeline):
+    """ the same pipeline with the array versions of the markers """
+    swap = {boilerpot.density_marker: density_marker, boilerpot.content_marker: content_marker}
+    return Pipeline(*[swap.get(r, r) for r in pipeline.rules], name=pipeline.name)
+
+simple_rules = vectorize(boilerpot.simple_rules)
+article_rules = vectorize(boilerpot.article_rules)
+strategies = [(article_rules, boilerpot.article_text), (simple_rules, boilerpot.simple_text)]
+
+def filter_pages(pages, rules, copy=True):
+    """ filter_page() over a list of pages from parse_page().  The rules with
+        a batch version (the markers above) score every page in one call, the
+        rest run page by page in between.
+    """
+    if copy:
+        pages = [page.copy() for page in pages]
+    streams = [page.blocks for page in pages]
+    segment = []
+    for r in rules.rules:
+        if not hasattr(r, 'batch'):
+            segment.append(r)
+            continue
+        run = Pipeline(*segment)
+        streams = [run(blocks) for blocks in streams]
+        segment = []
+        starts, total = [], 0
+        for blocks in streams:
+            starts.append(total)
+            total += len(blocks)
+        r.batch([block for blocks in streams for block in blocks], starts)
+    run = Pipeline(*segment)
+    for page, blocks in zip(pages, streams):
+        page.good = [block for block in run(blocks) if block.is_content]
+    return pages
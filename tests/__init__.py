@@ -0,0 +1,14 @@
+import glob
+import os
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+def pages():
+    """ [(name, raw bytes)] for the pages in tests/pages and the sample page """
+    fnames = sorted(glob.glob(os.path.join(here, 'pages', '*.html')))
+    fnames.append(os.path.join(os.path.dirname(here), 'boilerpot', 'sample.html'))
+    found = []
+    for fname in fnames:
+        with open(fname, 'rb') as f:
+            found.append((os.path.basename(fname), f.read()))
+    return found
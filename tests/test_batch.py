@@ -0,0 +1,44 @@
+import threading
+import time
+import unittest
+
+from boilerpot.batch import extract_many
+
+page = '<html><head><title>Batch</title></head><body><p>%s</p></body></html>' % ('Some words here. ' * 30)
+
+class ExtractManyTest(unittest.TestCase):
+    def test_order(self):
+        docs = [page.replace('Batch', 'Page %d' % i) for i in range(20)]
+        results = list(extract_many(docs, workers=2))
+        self.assertEqual([r.index for r in results], range(20))
+        self.assertEqual([r.title for r in results], ['Page %d' % i for i in range(20)])
+        self.assertTrue(all(r.error is None for r in results))
+
+    def test_error(self):
+        results = list(extract_many([page, None, page], workers=2))
+        self.assertEqual([r.error is None for r in results], [True, False, True])
+
+    def test_stop_early(self):
+        # more docs than the window holds, so the pool's task thread is left
+        # waiting for room when the consumer goes away
+        results = extract_many([page] * 200, workers=2)
+        next(results)
+        time.sleep(0.5)
+        closer = threading.Thread(target=results.close)
+        closer.daemon = True
+        closer.start()
+        closer.join(10)
+        self.assertFalse(closer.is_alive(), 'extract_many hung tearing down the pool')
+
+    def test_timeout_lxml(self):
+        # most of the time goes to lxml calling back into python, which is
+        # where the alarm mostly goes off
+        deep = '<html><body>%s%s</body></html>' % ('<div><p>words in a block here</p>' * 20000, '</div>' * 20000)
+        results = list(extract_many([deep] * 4 + [page], workers=1, timeout=0.05, parser='lxml'))
+        for result in results[:4]:
+            self.assertTrue(result.error and result.error.startswith('Timeout'), result.error)
+            self.assertTrue(result.seconds < 1.0, result.seconds)
+        self.assertEqual((results[4].title, results[4].error), ('Batch', None))
+
+if __name__ == '__main__':
+    unittest.main()
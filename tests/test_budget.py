@@ -0,0 +1,71 @@
+import unittest
+import warnings
+
+from boilerpot import boilerpot
+
+banner = ' '.join(['We use cookies to improve your experience on our site and to show you relevant advertising.'] * 4)
+paragraph = '<p>%s</p>' % ' '.join(['The council voted on the new bridge design after a long public consultation.'] * 4)
+comment = '<div class="comment"><p>%s</p></div>' % ('I drive over this bridge every day and it needs work. ' * 3)
+
+def page(comments=0):
+    return ('<html><head><title>Bridge vote</title></head><body><div id="cookies">%s</div>'
+            '<h1>Council approves the bridge</h1><div class="meta"><span>12 Comments</span></div>'
+            '<div id="article">%s</div><h3>Post a comment</h3>%s</body></html>') % (
+        banner, paragraph * 5, comment * comments)
+
+class BudgetTest(unittest.TestCase):
+    def test_boilerplate_before_end_of_text(self):
+        # the banner is plenty of words but isn't content, the comment count
+        # under the headline doesn't end the article
+        for parser in ['lxml', 'stream']:
+            budget = boilerpot.Budget()
+            title, body = boilerpot.extract_text(page(), parser, budget=budget)
+            self.assertEqual(body, boilerpot.extract_text(page(), parser)[1])
+            self.assertTrue(body.startswith('The council voted'))
+
+    def test_stop_at_end(self):
+        html = page(comments=500)
+        for parser in ['lxml', 'stream']:
+            budget = boilerpot.Budget()
+            title, body = boilerpot.extract_text(html, parser, budget=budget)
+            self.assertEqual(budget.truncated, 'end_of_text')
+            self.assertTrue(body.startswith('The council voted'))
+            self.assertNotIn('every day', body)
+
+    def test_max_blocks(self):
+        budget = boilerpot.Budget(stop_at_end=False, max_blocks=3)
+        page_ = boilerpot.parse_html(page(comments=50), 'stream', budget)
+        self.assertEqual(budget.truncated, 'max_blocks')
+        self.assertEqual(len(page_.parts), 3)
+
+    def test_default_is_unbounded(self):
+        # without a budget nothing looks for the end of the text
+        filtered = boilerpot.article_filter(page(comments=50), 'stream')
+        self.assertEqual(filtered.truncated, None)
+        self.assertFalse(any(block.flags & boilerpot.label.end_of_text for block in filtered.blocks))
+
+    def test_max_seconds_between_blocks(self):
+        # no blocks at all until the end, the time is checked on the tags
+        html = '<html><body><div>%s</div></body></html>' % ('<span><b>x</b> <i>y</i></span>' * 2000)
+        for parser in sorted(boilerpot.parsers):
+            ticks = []
+            def clock():
+                ticks.append(None)
+                return len(ticks)
+            budget = boilerpot.Budget(stop_at_end=False, max_seconds=10, clock=clock)
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')  # bs4 picking its own parser
+                state = boilerpot.parse_html(html, parser, budget)
+            self.assertEqual(budget.truncated, 'max_seconds', parser)
+            self.assertEqual(state.parts, [], parser)
+            self.assertTrue(len(ticks) < 20, parser)
+
+    def test_degraded(self):
+        clock = iter(range(1000)).next
+        budget = boilerpot.Budget(stop_at_end=False, max_seconds=5, clock=clock)
+        title, body = boilerpot.extract_text(page(comments=50), 'stream', budget=budget)
+        self.assertTrue(budget.degraded)
+        self.assertTrue(body)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from boilerpot.batch import extract_many
+from boilerpot.cache import DiskCache, ExtractionCache, cache_key
+
+page = '<html><head><title>Cached</title></head><body><p>%s</p></body></html>' % ('Some words here. ' * 30)
+
+class DiskCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'cache.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_put_get(self):
+        cache = DiskCache(self.path)
+        cache.put('key', [u'title', u'body'])
+        self.assertEqual(cache.get('key'), [u'title', u'body'])
+        self.assertEqual(cache.get('other'), None)
+        self.assertEqual(len(cache), 1)
+
+    def test_pickle(self):
+        # what extract_many does to hand it to the workers
+        cache = DiskCache(self.path)
+        cache.put('key', 1)
+        copy = pickle.loads(pickle.dumps(cache))
+        self.assertEqual(copy._db, None)
+        self.assertEqual(copy.get('key'), 1)
+
+    def test_extraction_cache(self):
+        cache = ExtractionCache(path=self.path)
+        first = cache.extract_text(page)
+        self.assertEqual(cache.extract_text(page), first)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        other = ExtractionCache(path=self.path)
+        self.assertEqual(other.extract_text(page), first)
+        self.assertEqual((other.hits, other.misses), (1, 0))
+
+    def test_key_headers(self):
+        headers = {'content-type': 'text/html; charset=UTF-8', 'date': 'Mon, 05 Jan 2015 10:00:00 GMT',
+                   'etag': '"1"', 'set-cookie': 'id=1'}
+        refetch = {'content-type': 'text/html; charset=utf8', 'date': 'Tue, 06 Jan 2015 11:00:00 GMT',
+                   'etag': '"2"', 'set-cookie': 'id=2', 'age': '10'}
+        key = cache_key(page, 'extract_text', None, headers)
+        self.assertEqual(cache_key(page, 'extract_text', None, refetch), key)
+        self.assertNotEqual(cache_key(page, 'extract_text', None, {'content-type': 'text/html; charset=latin-1'}),
+                            key)
+        self.assertNotEqual(cache_key(page, 'extract_text', None, dict(headers, **{'content-encoding': 'gzip'})),
+                            key)
+
+    def test_batch_stats(self):
+        cache = ExtractionCache(path=self.path)
+        pages = [page.replace('Cached', 'Cached %d' % i) for i in range(6)]
+        list(extract_many(pages, workers=2, cache=cache))
+        self.assertEqual((cache.hits, cache.misses), (0, 6))
+        list(extract_many(pages, workers=2, cache=cache))
+        self.assertEqual((cache.hits, cache.misses), (6, 6))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import random
+import re
+import unittest
+
+from boilerpot import cleaners
+from boilerpot.boilerpot import decode_data
+from boilerpot.cleaners import Normalizer, clean_html, edit_distance, prefix_distances
+from tests import pages
+
+# the replace() and re.sub() chain Normalizer took over from, as it was
+def old_microsoft(txt):
+    for char, value in [(u"\u201c", '"'), (u"\u201d", '"'), (u"\u2018", "'"), (u"\u2019", "'"), (u"\u02bc", "'"),
+                        (u"\u2063", " "), (u"\u2026", "..."), (u"\u2022", "-"), (u"\u25cf", "-"),
+                        (u"\u2012", "-"), (u"\u2013", "-"), (u"\u2014", "-"), (u"\u2015", "-"), (u"\u2053", "-"),
+                        (u"\u2e3a", "-"), (u"\u2e3b", "-"), (u"\u2025", ' '), (u"\xa0", ' ')]:
+        txt = txt.replace(char, value)
+    return txt
+
+def old_entities(html):
+    parts = []
+    curr = 0
+    for m in re.finditer('&#([xX]?)([0-9a-fA-F]+);', html):
+        parts.append(html[curr:m.start()])
+        ishex, number = m.groups()
+        parts.append(unichr(int(number, base=(16 if (ishex) else 10))))
+        curr = m.end()
+    parts.append(html[curr:])
+    html = ''.join(parts)
+    for code, translation in cleaners.entities.items():
+        html = html.replace('&%s;' % code, translation)
+    return html
+
+def old_whitespace(txt):
+    txt = txt.replace('\t', ' ')
+    txt = re.sub(' +', ' ', txt)
+    txt = txt.replace(' \n', '\n')
+    txt = txt.replace('\n ', '\n')
+    txt = re.sub(' +', ' ', txt)
+    txt = txt.replace('\n\n', '\n')
+    return txt
+
+def old_clean_html(html):
+    return old_whitespace(old_microsoft(old_entities(html)))
+
+pieces = [u'a', u'word', u' ', u'  ', u'\t', u'\n', u'\n\n', u'\n\n\n', u' \n ', u'\t\n\t', u'&', u';', u'#',
+          u'&nbsp;', u'&mdash;', u'&quot;', u'&amp;', u'&nbsp', u'&#65;', u'&#x41;', u'&#X26;', u'&#38;nbsp;',
+          u'&#38;', u'&#160;', u'&#8220;', u'&#x2014;', u'&#10;', u'&#9;', u'&#32;',
+          u'\u201c', u'\u201d', u'\u2019', u'\u2026', u'\u2022', u'\u2014', u'\u2063', u'\xa0', u'\xe9']
+
+class NormalizerTest(unittest.TestCase):
+    def test_same_as_before(self):
+        texts = [decode_data(data) for name, data in pages()]
+        rnd = random.Random(5)
+        for i in range(3000):
+            texts.append(u''.join(rnd.choice(pieces) for j in range(rnd.randint(0, 12))))
+        for text in texts:
+            self.assertEqual(clean_html(text), old_clean_html(text), repr(text[:200]))
+            self.assertEqual(cleaners.translate_microsoft(text), old_microsoft(text), repr(text[:200]))
+            self.assertEqual(cleaners.translate_html_entities(text), old_entities(text), repr(text[:200]))
+            self.assertEqual(cleaners.translate_whitespace(text), old_whitespace(text), repr(text[:200]))
+
+    def test_empty_tables(self):
+        text = u'a\u201c  b &nbsp; &#65;\n\n c'
+        self.assertEqual(Normalizer(chars={})(text), u'a\u201c b A\nc')
+        self.assertEqual(Normalizer(entities={})(text), u'a" b &nbsp; A\nc')
+        self.assertEqual(Normalizer(chars={}, entities={})(text), u'a\u201c b &nbsp; A\nc')
+
+# what nltk's edit_distance() says, no transpositions
+distances = [('', '', 0), ('a', '', 1), ('', 'abc', 3), ('abc', 'abc', 0), ('ab', 'ba', 2),
+             ('kitten', 'sitting', 3), ('flaw', 'lawn', 2), ('sunday', 'saturday', 3),
+             ('intention', 'execution', 5), ('gumbo', 'gambol', 2), ('book', 'back', 2)]
+
+class DistanceTest(unittest.TestCase):
+    def test_edit_distance(self):
+        for a, b, distance in distances:
+            self.assertEqual(edit_distance(a, b), distance, (a, b))
+            self.assertEqual(edit_distance(b, a), distance, (b, a))
+
+    def test_prefix_distances(self):
+        rnd = random.Random(3)
+        cases = [('', '', 0), ('', 'abc', 1), ('abc', '', 0), ('abc', 'abc', 0), ('abc', 'xbc', 0),
+                 ('kitten', 'sitting', 0), ('kitten', 'sitting', 1), ('kitten', 'sitting', 2)]
+        for i in range(2000):
+            a = ''.join(rnd.choice('ab c') for j in range(rnd.randint(0, 12)))
+            b = ''.join(rnd.choice('ab c') for j in range(rnd.randint(0, 12)))
+            cases.append((a, b, rnd.randint(0, 4)))
+        for a, b, limit in cases:
+            n = min(len(a), len(b))
+            want = [(i, edit_distance(a[:i], b[:i])) for i in range(1, n + 1)]
+            want = [(i, distance) for i, distance in want if distance <= limit]
+            self.assertEqual(list(prefix_distances(a, b, limit)), want, (a, b, limit))
+
+if __name__ == '__main__':
+    unittest.main()
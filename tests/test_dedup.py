@@ -0,0 +1,57 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from boilerpot.dedup import DuplicateIndex, minhash, similarity
+
+story = ('The city council voted on Tuesday to approve the new bridge design after a long public '
+         'consultation that drew hundreds of comments from residents, engineers and cyclists. ') * 3
+other = ('Heavy rain is expected across the region this weekend and forecasters have warned drivers '
+         'to take care on the roads, especially in low lying areas near the river. ') * 3
+
+class DuplicateIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'bodies.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_similarity(self):
+        self.assertEqual(similarity(minhash(story), minhash(story)), 1.0)
+        self.assertTrue(similarity(minhash(story), minhash(other)) < 0.2)
+
+    def test_add(self):
+        index = DuplicateIndex(self.path)
+        self.assertEqual(index.add('a', story), None)
+        self.assertEqual(index.add('b', other), None)
+        self.assertEqual(index.add('c', story + ' Copyright the wire service.'), 'a')
+        self.assertEqual(index.lookup(other), 'b')
+        self.assertEqual(index.add('d', 'too short'), None)
+        self.assertEqual(len(index), 2)
+
+    def test_add_again(self):
+        # a second run over the same input with the same index
+        index = DuplicateIndex(self.path)
+        self.assertEqual(index.add('a', story), None)
+        self.assertEqual(index.add('c', story), 'a')
+        self.assertEqual(DuplicateIndex(self.path).add('a', story), None)
+        self.assertEqual(index.add('c', story), 'a')
+        self.assertEqual(len(index), 1)
+
+    def test_reopen(self):
+        DuplicateIndex(self.path).add('a', story)
+        self.assertEqual(DuplicateIndex(self.path).lookup(story), 'a')
+        self.assertRaises(ValueError, lambda: DuplicateIndex(self.path, bands=4).db)
+
+    def test_pickle(self):
+        index = DuplicateIndex(self.path)
+        index.add('a', story)
+        copy = pickle.loads(pickle.dumps(index))
+        self.assertEqual(copy._db, None)
+        self.assertEqual(copy.lookup(story), 'a')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import gzip
+import StringIO
+import unittest
+import warnings
+
+from boilerpot import boilerpot
+from boilerpot.boilerpot import Extractor, extract_text
+from tests import pages
+
+def gzipped(data):
+    out = StringIO.StringIO()
+    with gzip.GzipFile(fileobj=out, mode='wb') as f:
+        f.write(data)
+    return out.getvalue()
+
+def fed(data, size, parser, **options):
+    extractor = Extractor(parser, **options)
+    for i in range(0, len(data), size):
+        extractor.feed(data[i:i + size])
+    return extractor.close()
+
+class ExtractorTest(unittest.TestCase):
+    def test_pieces(self):
+        warnings.simplefilter('ignore')  # bs4 picking its own parser
+        for name, data in pages():
+            for parser in ['lxml', 'stream', 'soup']:
+                want = extract_text(data, parser)
+                for size in [100, 4096, len(data)]:
+                    self.assertEqual(fed(data, size, parser), want, (name, parser, size))
+                    self.assertEqual(fed(gzipped(data), size, parser), want, (name, parser, size, 'gzip'))
+
+    def test_headers(self):
+        name, data = pages()[0]
+        headers = {'content-type': 'text/html; charset=utf-8'}
+        self.assertEqual(fed(data, 50, 'stream', headers=headers), extract_text(data, 'stream', headers))
+
+    def test_meta_charset(self):
+        # longer than sniff_bytes, so the <meta> is found and lxml gets more than one piece
+        sentences = {'iso-8859-1': u'Un caf\xe9 tr\xe8s bien fait, avec du th\xe9 et des g\xe2teaux pour tous.',
+                     'iso-8859-2': u'\u0141\xf3d\u017a i \u017c\xf3\u0142w, to s\u0105 s\u0142owa.',
+                     'windows-1251': u'The word for hello is \u043f\u0440\u0438\u0432\u0435\u0442, said many times a day.'}
+        for codec, sentence in sentences.items():
+            page = (u'<html><head><meta charset="%s"><title>%s</title></head><body>' % (codec, sentence[:10]) +
+                    u'<p>%s</p>\n' % (sentence * 3) * 100 + u'</body></html>').encode(codec)
+            self.assertTrue(len(page) > boilerpot.sniff_bytes)
+            headers = {'content-type': 'text/html; charset=%s' % codec}
+            for parser in ['lxml', 'stream']:
+                want = extract_text(page, parser)
+                self.assertIn(sentence, want[1])
+                for size in [100, 4096]:
+                    self.assertEqual(fed(page, size, parser), want, (codec, parser, size))
+                    self.assertEqual(fed(page, size, parser, headers=headers), want, (codec, parser, size, 'header'))
+
+    def test_title_before_close(self):
+        extractor = Extractor('stream')
+        extractor.feed('<html><head><title>Early</title></head><body>' + ' ' * 5000)
+        self.assertEqual(extractor.title, 'Early')
+        extractor.feed('<p>%s</p></body></html>' % ('words ' * 100))
+        self.assertEqual(extractor.close()[0], 'Early')
+
+    def test_done(self):
+        page = ('<html><body>' + '<p>%s</p>' % ('Article words here. ' * 10) * 5 + '<h3>Post a comment</h3>' +
+                '<p>%s</p>' % ('A comment. ' * 10) * 100)
+        budget = boilerpot.Budget(minwords=10)
+        extractor = Extractor('stream', budget=budget)
+        for i in range(0, len(page), 100):
+            extractor.feed(page[i:i + 100])
+            if extractor.done:
+                break
+        self.assertTrue(extractor.done)
+        title, body = extractor.close()
+        self.assertEqual(budget.truncated, 'end_of_text')
+        self.assertNotIn('A comment', body)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+import sys
+import unittest
+import warnings
+
+from boilerpot.boilerpot import extract_text, parsers
+
+class ParsersTest(unittest.TestCase):
+    def test_deep(self):
+        # deeper than python would let descend() recurse
+        warnings.simplefilter('ignore')  # bs4 picking its own parser
+        depth = sys.getrecursionlimit() * 3
+        html = ('<html><head><title>Deep page</title></head><body>' +
+                ''.join('<div>Level %d. This is a sentence with quite a few words in it so the blocks count. ' % i
+                        for i in range(depth)) +
+                '</div>' * depth + '</body></html>')
+        bodies = {}
+        for parser in sorted(parsers):
+            title, body = extract_text(html, parser)
+            self.assertEqual(title, 'Deep page', parser)
+            self.assertIn('Level 0.', body, parser)
+            self.assertIn('Level %d.' % (depth - 2), body, parser)
+            bodies[parser] = body
+        self.assertEqual(len(set(bodies.values())), 1, sorted(bodies))
+
+if __name__ == '__main__':
+    unittest.main()
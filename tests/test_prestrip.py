@@ -0,0 +1,44 @@
+import unittest
+import warnings
+
+from boilerpot import boilerpot
+from boilerpot.boilerpot import decode_data, strip_ignored
+from tests import pages
+
+class PrestripTest(unittest.TestCase):
+    def outputs(self, on):
+        was = boilerpot.prestrip
+        boilerpot.prestrip = on
+        try:
+            found = {}
+            for name, data in pages():
+                html = decode_data(data, {})
+                for parser in sorted(boilerpot.parsers):
+                    for func in [boilerpot.meat, boilerpot.meat2, boilerpot.extract_text]:
+                        found[name, parser, func.__name__] = func(html, parser)
+            return found
+        finally:
+            boilerpot.prestrip = was
+
+    def test_same_text(self):
+        warnings.simplefilter('ignore')  # bs4 picking its own parser
+        stripped, kept = self.outputs(True), self.outputs(False)
+        for key in sorted(kept):
+            self.assertEqual(stripped[key], kept[key], key)
+
+    def test_emptied(self):
+        html = (u'<body><!-- x --><p>yo <abbr>NASA</abbr></p><noscript>no</noscript>'
+                u'<script>x()</script><style>p{}</style><svg><path d="M0"/></svg></body>')
+        self.assertEqual(strip_ignored(html), u'<body><!----><p>yo <abbr>NASA</abbr></p><noscript></noscript>'
+                                              u'<script></script><style></style><svg></svg></body>')
+
+    def test_left_alone(self):
+        # the parsers don't all agree on these, so the page is left as it is
+        for html in [u'<html><title></title><body><script>x</script>hi</body>',
+                     u'<body><script>var a = 1</ script>b</script><p>hi</p></body>',
+                     u'<body><!-->hi<!-- x --><p>yo</p></body>',
+                     u'<body><svg><text>kept</text></svg></body>']:
+            self.assertEqual(strip_ignored(html), html)
+
+if __name__ == '__main__':
+    unittest.main()
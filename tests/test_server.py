@@ -0,0 +1,51 @@
+import threading
+import time
+import unittest
+
+from boilerpot import boilerpot
+from boilerpot.server import Service
+
+page = '<html><head><title>Served</title></head><body>%s</body></html>' % (
+    '<p>%s</p>' % ('Some words in a paragraph here. ' * 10) * 5)
+
+class ServiceTest(unittest.TestCase):
+    def test_extract(self):
+        service = Service(workers=0)
+        status, doc = service.handle('POST', '/extract', {}, page)
+        self.assertEqual(status, 200)
+        self.assertEqual(doc['title'], 'Served')
+        self.assertFalse(doc['degraded'])
+
+    def test_budget_is_per_request(self):
+        # process CPU time goes up with the other request threads' work too,
+        # a clock that jumps stands in for them
+        service = Service(workers=0, cpu_budget=0.5)
+        ticks = iter(range(0, 1000000, 10)).next
+        clock, time.clock = time.clock, ticks
+        try:
+            status, doc = service.handle('POST', '/extract', {}, page)
+        finally:
+            time.clock = clock
+        self.assertEqual(status, 200)
+        self.assertFalse(doc['degraded'])
+        self.assertEqual(doc['body'], Service(workers=0).handle('POST', '/extract', {}, page)[1]['body'])
+
+    def test_concurrent_stages(self):
+        # workers=0 runs each request in its caller's thread, each has to
+        # time only its own page
+        service = Service(workers=0, max_pending=100)
+        want = sorted(service.handle('POST', '/extract', {}, page)[1]['timings']['stages'])
+        found = []
+        def requests():
+            for i in range(10):
+                found.append(sorted(service.handle('POST', '/extract', {}, page)[1]['timings']['stages']))
+        threads = [threading.Thread(target=requests) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(found, [want] * 40)
+        self.assertIsNone(boilerpot.traced.tracer)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+import subprocess
+import sys
+import unittest
+
+from boilerpot import bench
+
+class StartupTest(unittest.TestCase):
+    def test_lazy_imports(self):
+        heavy = ['bs4', 'BeautifulSoup', 'lxml', 'lxml.etree', 'multiprocessing', 'sqlite3']
+        code = 'import sys, boilerpot; print [name for name in %r if name in sys.modules]' % heavy
+        loaded = subprocess.check_output([sys.executable, '-c', code], env=bench.environ()).strip()
+        self.assertEqual(loaded, '[]')
+
+    def test_budget(self):
+        # a busy machine can be slow for longer than one startup() takes, a
+        # regression is over budget every time
+        for attempt in range(3):
+            over = [(what, seconds) for what, seconds in bench.startup().items()
+                    if seconds > bench.startup_budget[what]]
+            if not over:
+                break
+        self.assertEqual(over, [], ', '.join('%s took %.1fms' % (what, seconds * 1000) for what, seconds in over))
+
+if __name__ == '__main__':
+    unittest.main()
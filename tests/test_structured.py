@@ -0,0 +1,55 @@
+import StringIO
+import unittest
+import warnings
+
+from boilerpot import boilerpot
+from boilerpot.structured import extract_blocks, write_page, read_pages, write_json, read_json
+from tests import pages
+
+def extracted():
+    """ [(name, parser, Page)] for the test pages """
+    warnings.simplefilter('ignore')  # bs4 picking its own parser
+    return [(name, parser, extract_blocks(data, parser))
+            for name, data in pages() for parser in ['lxml', 'stream', 'soup']]
+
+def round_trip(write, read, pages):
+    f = StringIO.StringIO()
+    for page in pages:
+        write(f, page)
+    f.seek(0)
+    return list(read(f))
+
+class StructuredTest(unittest.TestCase):
+    def test_body(self):
+        for name, data in pages():
+            for parser in ['lxml', 'stream', 'soup']:
+                page = extract_blocks(data, parser)
+                self.assertEqual((page.title, page.body), boilerpot.extract_text(data, parser), (name, parser))
+                if page.best is not None:
+                    self.assertTrue(page.blocks[page.best].is_content, (name, parser))
+
+    def check(self, write, read):
+        found = extracted()
+        back = round_trip(write, read, [page for name, parser, page in found])
+        self.assertEqual(len(back), len(found))
+        for (name, parser, page), read_page in zip(found, back):
+            self.assertEqual(read_page, page, (name, parser))
+            self.assertEqual([block.text(read_page.text) for block in read_page.blocks],
+                             [block.text(page.text) for block in page.blocks], (name, parser))
+
+    def test_binary(self):
+        self.check(write_page, read_pages)
+
+    def test_json(self):
+        self.check(write_json, read_json)
+
+    def test_truncated(self):
+        f = StringIO.StringIO()
+        write_page(f, extracted()[0][2])
+        data = f.getvalue()
+        for cut in [3, len(data) - 1]:
+            with self.assertRaises(ValueError):
+                list(read_pages(StringIO.StringIO(data[:cut])))
+
+if __name__ == '__main__':
+    unittest.main()
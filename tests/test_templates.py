@@ -0,0 +1,23 @@
+import unittest
+
+from boilerpot.boilerpot import extract_text
+from boilerpot.templates import TemplateIndex
+
+nav = '<div id="nav"><a href="/">Home</a> <a href="/news">News</a> <a href="/about">About</a></div>'
+
+def page(story):
+    paragraph = '<p>%s The council met on Tuesday to talk about the bridge, the roads and the budget.</p>' % story
+    return '<html><head><title>Site</title></head><body>%s%s</body></html>' % (nav, paragraph * 5)
+
+class TemplateIndexTest(unittest.TestCase):
+    def test_same_page_twice(self):
+        # a host can serve the same page twice in a row, both count
+        index = TemplateIndex(min_pages=2)
+        for i in range(2):
+            extract_text(page('The same story again.'), 'stream', site=index.site('example.com'))
+        host = index.hosts['example.com']
+        self.assertEqual(host.pages, 2)
+        self.assertEqual(max(host.blocks.values()), 2)
+
+if __name__ == '__main__':
+    unittest.main()
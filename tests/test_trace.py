@@ -0,0 +1,45 @@
+import time
+import unittest
+
+from boilerpot import boilerpot
+from boilerpot.boilerpot import rule, Pipeline, Text
+from boilerpot.trace import Tracer, tracing
+
+@rule('curr')
+def fast(prev, block, next, state):
+    pass
+
+@rule('list')
+def slow_list(blocks):
+    time.sleep(0.05)
+
+@rule('curr')
+def slow_curr(prev, block, next, state):
+    time.sleep(0.01)
+
+class TracerTest(unittest.TestCase):
+    def test_rule_after_list(self):
+        # the 'list' rule's pass is already on the clock when the rule after
+        # it starts, it mustn't come out of that rule's time
+        pipeline = Pipeline(fast, slow_list, slow_curr, fast, name='test')
+        blocks = [Text(u'some words here') for i in range(5)]
+        with tracing(Tracer()) as tracer:
+            self.assertEqual(len(pipeline(blocks)), 5)
+        seconds = dict((stage, seconds) for stage, seconds, count, rss in tracer.stages)
+        self.assertEqual(len(seconds), 3)  # fast twice under one name
+        self.assertAlmostEqual(seconds['test.slow_list'], 0.05, delta=0.03)
+        self.assertAlmostEqual(seconds['test.slow_curr'], 0.05, delta=0.03)
+        counts = [count for stage, seconds, count, rss in tracer.stages]
+        self.assertEqual(counts, [5] * 4)
+
+    def test_stages(self):
+        with tracing() as tracer:
+            tracer.begin()
+            boilerpot.extract_text('<html><body><p>%s</p></body></html>' % ('word ' * 50))
+        stages = [stage for stage, seconds, count, rss in tracer.stages]
+        for stage in ['decode', 'parse', 'article.content_marker', 'simple.largest_block']:
+            self.assertIn(stage, stages)
+        self.assertTrue(all(seconds >= 0 for stage, seconds, count, rss in tracer.stages))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import json
+import os
+import random
+import unittest
+
+from boilerpot import boilerpot, vectorized
+from boilerpot.boilerpot import best_filter, decode_data, extract_text, filter_page, parse_page
+from tests import here, pages
+
+# extract_text() for the test pages, as it was when the NumPy markers went in
+with open(os.path.join(here, 'pages', 'expected.json'), 'rb') as f:
+    expected = json.load(f)
+
+def labels(page):
+    return ([(block.text, block.flags, block.ignore) for block in page.blocks],
+            [block.text for block in page.good])
+
+def made_up_page(rnd):
+    """ blocks with word counts either side of the markers' thresholds,
+        some of them inside a link
+    """
+    parts = []
+    for i in range(rnd.randint(1, 30)):
+        n = rnd.choice([0, 1, 3, 5, 8, 10, 12, 15, 16, 17, 18, 20, 21, 30, 41, 60, 101, 150])
+        links = rnd.choice([0, 0, rnd.randint(0, n), n])
+        words = ['word%d' % j for j in range(n)]
+        text = ' '.join(words[links:])
+        if links:
+            text = '<a href="/x">%s</a> %s' % (' '.join(words[:links]), text)
+        tag = rnd.choice(['p', 'div', 'li', 'h2', 'td'])
+        block = '<%s>%s.</%s>' % (tag, text, tag)
+        parts.append('<a href="/y">%s</a>' % block if not links and rnd.random() < 0.3 else block)
+    return u'<html><head><title>T</title></head><body>%s</body></html>' % '\n'.join(parts)
+
+class VectorizedTest(unittest.TestCase):
+    def test_pinned(self):
+        for name, data in pages():
+            for parser, want in sorted(expected[name].items()):
+                self.assertEqual(list(extract_text(data, parser)), want, (name, parser))
+
+    def check(self, parsed):
+        for rules, pipeline in [(boilerpot.article_rules, vectorized.article_rules),
+                                (boilerpot.simple_rules, vectorized.simple_rules)]:
+            batch = vectorized.filter_pages([page for name, page in parsed], pipeline)
+            for (name, page), filtered in zip(parsed, batch):
+                self.assertEqual(labels(filtered), labels(filter_page(page, rules)), name)
+
+    def test_same_as_rules(self):
+        for parser in ['lxml', 'stream']:
+            parsed = [(name, parse_page(decode_data(data), parser)) for name, data in pages()]
+            for name, page in parsed:
+                self.assertEqual(list(best_filter(page, vectorized.strategies)[1:]), expected[name][parser], name)
+            self.check(parsed)
+
+    def test_made_up_pages(self):
+        rnd = random.Random(1)
+        self.check([(i, parse_page(made_up_page(rnd), 'stream')) for i in range(300)])
+
+    def test_without_numpy(self):
+        numpy, vectorized.numpy = vectorized.numpy, None
+        try:
+            rnd = random.Random(2)
+            self.check([(i, parse_page(made_up_page(rnd), 'stream')) for i in range(50)])
+        finally:
+            vectorized.numpy = numpy
+
+if __name__ == '__main__':
+    unittest.main()